@@ -1,124 +1,215 @@
-from .tools import (
-    fetch_all_code_from_repo,
-    extract_owner,
-    extract_repo,
-    get_ta_role_for_forum,
-    search_youtube,
-    search_db
-)
-
-from openai import OpenAI
-import requests
+from .executor import ToolExecutor
+from .store import DATA_DIR, PostStore
+from .cache import TTLCache
+from .scheduler import RunScheduler
+from .retry import RetryTransport
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, NotFoundError
+import asyncio
+import httpx
 import tempfile
 from loguru import logger
 import json
-import time
+import hashlib
+import re
 import os
-import shutil
+from .retrieval import CHROMA_PATH, get_embedding_function, set_vector_store
 from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain.schema.document import Document
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+from langchain_community.document_loaders import PyPDFLoader
 
 
 class Assistant:
-    def __init__(self, file_paths=None):
-        self.client = OpenAI()
-        self.posts = {}  # Maps Discord post IDs to OpenAI thread IDs
+    ASSISTANT_NAME = "Data Science Teaching Assistant"
+    POLL_INTERVAL = 1  # seconds, doubled while a run stays in progress
+    MAX_POLL_INTERVAL = 5
+    RUN_TIMEOUT = 10 * 60  # seconds a polled run may take before it is cancelled
+    MAX_PARALLEL_TOOLS = 4  # concurrent tool calls per required action
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024  # larger attachments spill to a temp file
+    MAX_FILE_SIZE = 25 * 1024 * 1024
+    MAX_PARALLEL_UPLOADS = 4
+    # Run search_db and the TA role lookup before the first run instead of
+    # waiting for the model to request them
+    PREFETCH_CONTEXT = os.getenv("PREFETCH_CONTEXT", "false").lower() in ("1", "true", "yes")
+    # File types accepted by the code interpreter
+    SUPPORTED_FILE_TYPES = {
+        ".c", ".cs", ".cpp", ".csv", ".doc", ".docx", ".html", ".java", ".json",
+        ".md", ".pdf", ".php", ".pptx", ".py", ".rb", ".tex", ".txt", ".css",
+        ".js", ".sh", ".ts", ".xlsx", ".xml", ".zip", ".tar", ".pkl",
+        ".jpeg", ".jpg", ".gif", ".png", ".ipynb",
+    }
 
-        self.CHROMA_PATH = "chroma"
+    def __init__(self, file_paths=None):
+        self.scheduler = RunScheduler()
+        # Retries are handled by the shared policy in RetryTransport
+        self.client = AsyncOpenAI(max_retries=0, http_client=DefaultAsyncHttpxClient(
+            transport=RetryTransport(),
+            event_hooks={"response": [self._observe_rate_limits]}))
+        self.posts = PostStore()  # Maps Discord post IDs to OpenAI thread IDs
+        self.tools = ToolExecutor()
+        self.http = httpx.AsyncClient(timeout=60, follow_redirects=True)
+        # (content hash, file name) -> OpenAI file ID of recent uploads
+        self.uploads = TTLCache(maxsize=512, ttl=24 * 60 * 60)
+        self.filenames = TTLCache(maxsize=1024)  # OpenAI file ID -> file name
+        self.prefetched = TTLCache(maxsize=1024, ttl=60 * 60)  # thread IDs with context
+        self.assistant = None
+
+        self.CHROMA_PATH = CHROMA_PATH
         self.create_vector_store(file_paths)
         with open("instructions.txt", "r") as file:
-            instructions = file.read()
-        self.create_assistant(instructions)
+            self.instructions = file.read()
 
-    def create_vector_store(self, file_paths):
-        """Creates a Chroma vector store and adds documents to it."""
-        # Clear existing database if it exists
-        if os.path.exists(self.CHROMA_PATH):
-            shutil.rmtree(self.CHROMA_PATH)
+    async def _observe_rate_limits(self, response):
+        """Feeds OpenAI rate-limit headers into the run scheduler's token bucket."""
+        self.scheduler.bucket.update_from_headers(response.headers)
+        if response.status_code == 429:
+            try:
+                self.scheduler.bucket.block_for(float(response.headers.get("retry-after", 1)))
+            except ValueError:
+                self.scheduler.bucket.block_for(1)
 
-        # Initialize the embedding function
-        embedding_function = OpenAIEmbeddings(model="text-embedding-3-large")
+    async def start(self):
+        """Creates the OpenAI assistant. Must be awaited before handling posts."""
+        await self.create_assistant(self.instructions)
 
-        # Initialize Chroma DB
+    def create_vector_store(self, file_paths):
+        """
+        Syncs the persisted Chroma vector store with the given documents.
+
+        Source files and chunks are content-hashed and diffed against the
+        manifest stored next to the database, so only added or changed chunks
+        are embedded and chunks of removed files are deleted. A restart with
+        unchanged docs makes no embedding calls.
+        """
+        # Open the persisted Chroma DB (created on first run)
         self.vector_store = Chroma(
             persist_directory=self.CHROMA_PATH,
-            embedding_function=embedding_function
+            embedding_function=get_embedding_function()
         )
 
-        # Process and add documents if file paths are provided
-        if file_paths:
-            documents = []
-
-            # Check if any PDF files are in a directory
-            pdf_directories = []
-            non_pdf_files = []
-
-            for path in file_paths:
-                if os.path.isdir(path):
-                    # Check if directory contains PDF files
-                    if any(f.lower().endswith('.pdf') for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))):
-                        pdf_directories.append(path)
-                elif path.lower().endswith('.pdf'):
-                    # If it's a single PDF file, add its directory
-                    pdf_dir = os.path.dirname(path)
-                    if pdf_dir not in pdf_directories:
-                        pdf_directories.append(pdf_dir)
-                else:
-                    non_pdf_files.append(path)
-
-            # Load PDFs using PyPDFDirectoryLoader
-            for pdf_dir in pdf_directories:
-                logger.info(f"Loading PDFs from directory: {pdf_dir}")
-                pdf_loader = PyPDFDirectoryLoader(pdf_dir)
-                pdf_documents = pdf_loader.load()
-                documents.extend(pdf_documents)
-                logger.info(
-                    f"Loaded {len(pdf_documents)} PDF documents from {pdf_dir}")
+        manifest = self._load_manifest()
+        persisted_ids = set(self.vector_store.get(include=[])["ids"])
 
-            # Load other non-PDF files
-            for path in non_pdf_files:
-                logger.info(
-                    f"Processing non-PDF file for vector store: {path}")
-                try:
-                    with open(path, "r", encoding="utf-8") as file:
-                        content = file.read()
-                        doc = Document(
-                            page_content=content,
-                            metadata={"source": path}
-                        )
-                        documents.append(doc)
-                except UnicodeDecodeError:
-                    logger.warning(f"Could not read {path} as text. Skipping.")
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=800,
+            chunk_overlap=80,
+            length_function=len,
+            is_separator_regex=False,
+        )
 
+        new_manifest = {}
+        changed_chunks = []
+        for path in self._collect_files(file_paths or []):
+            file_hash = self._hash_file(path)
+            entry = manifest.get(path)
+            if (entry and entry["hash"] == file_hash
+                    and persisted_ids.issuperset(entry["chunks"])):
+                new_manifest[path] = entry
+                continue
+
+            documents = self._load_documents(path)
             if not documents:
-                logger.warning(
-                    "No documents were loaded. Vector store will be empty.")
-                return
-
-            # Split documents into chunks
-            logger.info(f"Splitting {len(documents)} documents into chunks")
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=800,
-                chunk_overlap=80,
-                length_function=len,
-                is_separator_regex=False,
-            )
-            chunks = text_splitter.split_documents(documents)
+                continue
+
+            chunks = self._calculate_chunk_ids(
+                text_splitter.split_documents(documents))
+            known_chunks = entry["chunks"] if entry else {}
+            chunk_hashes = {}
+            for chunk in chunks:
+                chunk_id = chunk.metadata["id"]
+                chunk_hash = self._hash_text(chunk.page_content)
+                chunk_hashes[chunk_id] = chunk_hash
+                if chunk_id not in persisted_ids or known_chunks.get(chunk_id) != chunk_hash:
+                    changed_chunks.append(chunk)
+
+            logger.info(f"Source changed: {path} ({len(chunks)} chunks)")
+            new_manifest[path] = {"hash": file_hash, "chunks": chunk_hashes}
+
+        wanted_ids = {
+            chunk_id for entry in new_manifest.values() for chunk_id in entry["chunks"]
+        }
+        stale_ids = list(persisted_ids - wanted_ids)
+
+        if stale_ids:
+            logger.info(f"Deleting {len(stale_ids)} stale chunks from vector store")
+            self.vector_store.delete(ids=stale_ids)
+
+        if changed_chunks:
+            # Chroma upserts by ID, so changed chunks replace their old version
+            logger.info(
+                f"Embedding {len(changed_chunks)} new or changed chunks")
+            self.vector_store.add_documents(
+                changed_chunks, ids=[chunk.metadata["id"] for chunk in changed_chunks])
 
-            # Process chunks and add IDs
-            chunks_with_ids = self._calculate_chunk_ids(chunks)
-            chunk_ids = [chunk.metadata["id"] for chunk in chunks_with_ids]
+        self._save_manifest(new_manifest)
+        # Share the synced store with search_db
+        set_vector_store(self.vector_store)
 
-            # Add documents to Chroma
+        if not wanted_ids:
+            logger.warning("No documents were loaded. Vector store is empty.")
+        else:
             logger.info(
-                f"Adding {len(chunks_with_ids)} chunks to vector store")
-            self.vector_store.add_documents(chunks_with_ids, ids=chunk_ids)
-            # self.vector_store.persist()
+                f"Vector store in sync: {len(wanted_ids)} chunks, "
+                f"{len(changed_chunks)} embedded, {len(stale_ids)} deleted.")
+
+    def _collect_files(self, file_paths):
+        """Expands directories (PDFs only) and returns the sorted list of source files."""
+        files = set()
+        for path in file_paths:
+            if os.path.isdir(path):
+                files.update(
+                    os.path.join(path, f) for f in os.listdir(path)
+                    if f.lower().endswith('.pdf') and os.path.isfile(os.path.join(path, f))
+                )
+            elif os.path.isfile(path):
+                files.add(path)
+        return sorted(files)
 
-            logger.info("All documents added successfully to Chroma DB.")
+    def _load_documents(self, path):
+        """Loads a single source file into documents."""
+        if path.lower().endswith('.pdf'):
+            logger.info(f"Loading PDF: {path}")
+            return PyPDFLoader(path).load()
+
+        logger.info(f"Processing non-PDF file for vector store: {path}")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return [Document(page_content=file.read(), metadata={"source": path})]
+        except UnicodeDecodeError:
+            logger.warning(f"Could not read {path} as text. Skipping.")
+            return []
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _manifest_path(self):
+        return os.path.join(self.CHROMA_PATH, "manifest.json")
+
+    def _load_manifest(self):
+        """Returns {source: {"hash": file_hash, "chunks": {chunk_id: chunk_hash}}}."""
+        try:
+            with open(self._manifest_path(), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.CHROMA_PATH, exist_ok=True)
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
 
     def _calculate_chunk_ids(self, chunks):
         """Calculate unique IDs for each chunk, similar to rag2 implementation."""
@@ -145,8 +236,14 @@ class Assistant:
 
         return chunks
 
-    def create_assistant(self, instructions, model="gpt-4o"):
-        """Creates an assistant using the newly created vector store."""
+    async def create_assistant(self, instructions, model="gpt-4o"):
+        """
+        Creates the assistant, or reuses the one from a previous boot.
+
+        Instructions, tool schemas and model are fingerprinted; a matching
+        existing assistant is reused as is and updated in place only when
+        the fingerprint changed.
+        """
         if not self.vector_store:
             raise ValueError(
                 "Vector store must be created before initializing an assistant."
@@ -171,55 +268,144 @@ class Assistant:
 
         # Create the assistant without directly attaching the vector store
         # since we're now using Chroma DB instead of OpenAI's vector store
-        self.assistant = self.client.beta.assistants.create(
-            name="Data Science Teaching Assistant",
-            instructions=instructions,
-            model=model,
-            tools=tool_schemas["tools"],
-        )
+        params = {
+            "name": self.ASSISTANT_NAME,
+            "instructions": instructions,
+            "model": model,
+            "tools": tool_schemas["tools"],
+        }
+        fingerprint = hashlib.sha256(
+            json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+        metadata = {"fingerprint": fingerprint}
+
+        assistant = await self._find_assistant()
+        if assistant is None:
+            assistant = await self.client.beta.assistants.create(
+                **params, metadata=metadata)
+            logger.info(f"Created assistant {assistant.id}")
+        elif (assistant.metadata or {}).get("fingerprint") != fingerprint:
+            assistant = await self.client.beta.assistants.update(
+                assistant.id, **params, metadata=metadata)
+            logger.info(f"Updated assistant {assistant.id} with new configuration")
+        else:
+            logger.info(f"Reusing assistant {assistant.id}")
+
+        self.assistant = assistant
+        self._save_assistant_record(assistant.id)
+
+    def _assistant_record_path(self):
+        return os.path.join(DATA_DIR, "assistant.json")
+
+    async def _find_assistant(self):
+        """Returns the assistant used by a previous boot, if it still exists."""
+        try:
+            with open(self._assistant_record_path(), "r") as f:
+                assistant_id = json.load(f)["id"]
+            return await self.client.beta.assistants.retrieve(assistant_id)
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            pass
+        except NotFoundError:
+            logger.warning("Recorded assistant no longer exists, looking it up by name")
+
+        # No usable record (e.g. fresh disk), fall back to the newest one by name
+        async for assistant in self.client.beta.assistants.list(order="desc", limit=100):
+            if assistant.name == self.ASSISTANT_NAME:
+                return assistant
+        return None
+
+    def _save_assistant_record(self, assistant_id):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(self._assistant_record_path(), "w") as f:
+            json.dump({"id": assistant_id}, f)
+
+    async def upload_file(self, file_path):
+        """
+        Uploads a file (local path or URL) to OpenAI and returns its file ID.
 
-    def upload_file(self, file_path):
-        """Uploads a file to OpenAI."""
+        The download is spooled in memory, spilling to disk only for large
+        files, and hashed on the way; the same file uploaded recently is
+        reused instead of being sent again.
+        """
+        file_name = os.path.basename(file_path.split("?")[0])
+        if file_name.endswith(".ipynb"):
+            # Notebooks are JSON, upload them under a type the code interpreter reads
+            file_name += ".json"
+        digest = hashlib.sha256()
         try:
-            if file_path.startswith("http"):
-                response = requests.get(file_path, stream=True)
-                response.raise_for_status()
-
-                file_name = file_path.split("/")[-1].split("?")[0]
-
-                with tempfile.NamedTemporaryFile(
-                    suffix=f"_{file_name}", delete=False
-                ) as temp:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        temp.write(chunk)
-                    file_path = temp.name
-
-            with open(file_path, "rb") as file:
-                logger.info(f"Uploading file: {file_path}")
-                return self.client.files.create(file=file, purpose="assistants")
-        except requests.RequestException as e:
-            print(f"Error downloading the file from URL: {e}")
+            with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE) as buffer:
+                if file_path.startswith("http"):
+                    async with self.http.stream("GET", file_path) as response:
+                        response.raise_for_status()
+                        if int(response.headers.get("Content-Length", 0)) > self.MAX_FILE_SIZE:
+                            raise ValueError(f"{file_name} exceeds {self.MAX_FILE_SIZE} bytes")
+                        async for chunk in response.aiter_bytes(self.UPLOAD_CHUNK_SIZE):
+                            digest.update(chunk)
+                            buffer.write(chunk)
+                            if buffer.tell() > self.MAX_FILE_SIZE:
+                                raise ValueError(f"{file_name} exceeds {self.MAX_FILE_SIZE} bytes")
+                else:
+                    if os.path.getsize(file_path) > self.MAX_FILE_SIZE:
+                        raise ValueError(f"{file_name} exceeds {self.MAX_FILE_SIZE} bytes")
+                    with open(file_path, "rb") as file:
+                        for chunk in iter(lambda: file.read(self.UPLOAD_CHUNK_SIZE), b""):
+                            digest.update(chunk)
+                            buffer.write(chunk)
+
+                cache_key = (digest.hexdigest(), file_name)
+                file_id = self.uploads.get(cache_key)
+                if file_id:
+                    logger.info(f"Reusing uploaded file {file_id} for {file_name}")
+                    return file_id
+
+                buffer.seek(0)
+                logger.info(f"Uploading file: {file_name}")
+                uploaded = await self.client.files.create(
+                    file=(file_name, buffer), purpose="assistants")
+        except httpx.HTTPError as e:
+            logger.error(f"Error downloading the file from URL: {e}")
             raise
         except OSError as e:
-            print(f"Error handling the file: {e}")
-            raise
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            logger.error(f"Error handling the file: {e}")
             raise
 
-    def _prepare_attachments(self, file_paths):
-        """Utility method to prepare file attachments."""
-        attachments = []
-        if file_paths:
-            for path in file_paths:
-                message_file = self.upload_file(path)
-                attachments.append({
-                    "file_id": message_file.id,
-                    "tools": [
-                        {"type": "code_interpreter"},
-                    ],
-                })
-        return attachments
+        self.uploads.set(cache_key, uploaded.id)
+        return uploaded.id
+
+    async def _prepare_attachments(self, file_paths):
+        """
+        Utility method to prepare file attachments.
+
+        Files are uploaded concurrently (at most MAX_PARALLEL_UPLOADS at a
+        time). Unsupported types are rejected before any download, and files
+        that are too large or fail to upload are skipped.
+        """
+        if not file_paths:
+            return []
+
+        semaphore = asyncio.Semaphore(self.MAX_PARALLEL_UPLOADS)
+
+        async def prepare(path):
+            extension = os.path.splitext(path.split("?")[0])[1].lower()
+            if extension not in self.SUPPORTED_FILE_TYPES:
+                logger.warning(f"Skipping unsupported attachment type: {path}")
+                return None
+            async with semaphore:
+                try:
+                    return await self.upload_file(path)
+                except Exception as e:
+                    logger.error(f"Skipping attachment {path}: {e}")
+                    return None
+
+        file_ids = await asyncio.gather(*(prepare(path) for path in file_paths))
+        return [
+            {
+                "file_id": file_id,
+                "tools": [
+                    {"type": "code_interpreter"},
+                ],
+            }
+            for file_id in file_ids if file_id
+        ]
 
     def _prepare_content(self, message, image_urls=None):
         """Utility method to prepare message content."""
@@ -231,165 +417,300 @@ class Assistant:
             )
         return content
 
-    def _handle_run(self, thread_id, run):
+    async def _handle_run(self, thread_id, run):
         """Common method to handle run status and responses."""
+        delay = self.POLL_INTERVAL
+        deadline = asyncio.get_running_loop().time() + self.RUN_TIMEOUT
         while True:
-            run_status = self.client.beta.threads.runs.retrieve(
+            if asyncio.get_running_loop().time() > deadline:
+                logger.error(f"Run {run.id} timed out after {self.RUN_TIMEOUT}s, cancelling it")
+                try:
+                    await self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+                except Exception as e:
+                    logger.warning(f"Could not cancel run {run.id}: {e}")
+                raise RuntimeError("The assistant run has timed out.")
+
+            run_status = await self.client.beta.threads.runs.retrieve(
                 thread_id=thread_id, run_id=run.id
             )
 
             if run_status.status == "completed":
                 logger.info("Run completed successfully.")
-                messages = list(
-                    self.client.beta.threads.messages.list(
+                messages = [
+                    message async for message in self.client.beta.threads.messages.list(
                         thread_id=thread_id, run_id=run.id
                     )
-                )
+                ]
                 return messages
             elif run_status.status == "requires_action":
                 logger.info(
                     "Run requires action. Processing required tool calls...")
-                self.call_required_functions(
+                await self.call_required_functions(
                     run=run,
                     required_actions=run_status.required_action.submit_tool_outputs.model_dump(),
                     thread_id=thread_id
                 )
+                delay = self.POLL_INTERVAL
             elif run_status.status == "failed":
-                logger.error(f"Run failed: {run_status.last_error.message}")
-                if run_status.last_error.code == 'rate_limit_exceeded':
-                    error_msg = "Your GitHub link is too general. Please specify a specific folder in your GitHub repository."
-                    self.client.beta.threads.messages.create(
-                        thread_id=thread_id,
-                        role="assistant",
-                        content=error_msg
-                    )
-                    return error_msg
-                raise RuntimeError("The assistant run has failed.")
+                return await self._handle_failed_run(thread_id, run_status)
+            elif run_status.status in ("cancelled", "expired", "incomplete"):
+                raise RuntimeError(f"The assistant run has ended: {run_status.status}")
             else:
                 logger.info(
                     "Run is in progress. Waiting for the next update...")
-                time.sleep(5)
+                # Yield to the event loop so other runs keep progressing
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_POLL_INTERVAL)
+
+    async def _handle_failed_run(self, thread_id, run):
+        """Turns a failed run into a reply to the learner, or raises."""
+        logger.error(f"Run failed: {run.last_error.message}")
+        if run.last_error.code == 'rate_limit_exceeded':
+            error_msg = "Your GitHub link is too general. Please specify a specific folder in your GitHub repository."
+            await self.client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="assistant",
+                content=error_msg
+            )
+            return error_msg
+        raise RuntimeError("The assistant run has failed.")
+
+    async def _stream_run(self, thread_id, stream, on_text):
+        """
+        Consumes a run event stream, forwarding text deltas to `on_text`.
 
-    def create_thread(self, message, files=None, images=None, forum_id=None):
+        Tool calls are handled inline: their outputs are submitted on a new
+        stream, which is consumed in turn until the run ends.
+        """
+        while stream is not None:
+            next_stream = None
+            try:
+                async for event in stream:
+                    if event.event == "thread.message.delta":
+                        for part in event.data.delta.content or []:
+                            if part.type == "text" and part.text and part.text.value:
+                                await on_text(part.text.value)
+                    elif event.event == "thread.run.requires_action":
+                        logger.info(
+                            "Run requires action. Processing required tool calls...")
+                        run = event.data
+                        tool_outputs = await self._run_tools(
+                            run.required_action.submit_tool_outputs.model_dump())
+                        next_stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                            thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs, stream=True
+                        )
+                    elif event.event == "thread.run.completed":
+                        logger.info("Run completed successfully.")
+                        return [
+                            message async for message in self.client.beta.threads.messages.list(
+                                thread_id=thread_id, run_id=event.data.id
+                            )
+                        ]
+                    elif event.event == "thread.run.failed":
+                        return await self._handle_failed_run(thread_id, event.data)
+                    elif event.event in ("thread.run.cancelled", "thread.run.expired",
+                                         "thread.run.incomplete", "error"):
+                        raise RuntimeError(f"The assistant run has ended: {event.event}")
+            finally:
+                await stream.close()
+            stream = next_stream
+        raise RuntimeError("The assistant run stream ended unexpectedly.")
+
+    async def create_thread(self, message, files=None, images=None, forum_id=None):
         """Creates an OpenAI thread from a Discord post."""
-        attachments = self._prepare_attachments(files)
         content = self._prepare_content(message, images)
 
         # Add forum_id as system message if provided
-        messages = [{
-            "role": "user",
-            "content": content,
-            "attachments": attachments,
-        }]
+        preamble = []
         if forum_id:
-            messages.insert(0, {
+            preamble.append({
                 "role": "assistant",
                 "content": f"Current forum_id: {forum_id}"
             })
 
-        return self.client.beta.threads.create(messages=messages)
+        if not files and not (self.PREFETCH_CONTEXT and forum_id):
+            return await self.client.beta.threads.create(messages=[
+                *preamble, {"role": "user", "content": content}
+            ])
+
+        # Create the thread while the attachments upload and the context is
+        # retrieved, then post the learner's message once everything is ready
+        thread, attachments, context = await asyncio.gather(
+            self.client.beta.threads.create(messages=preamble),
+            self._prepare_attachments(files),
+            self._prefetch_context(message, forum_id),
+        )
+        if context:
+            content.append({"type": "text", "text": context})
+            self.prefetched.set(thread.id, True)
+        await self.client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=content,
+            attachments=attachments
+        )
+        return thread
 
-    def add_message(self, role, content, post_id, files=None, images=None):
+    async def _prefetch_context(self, message, forum_id):
+        """
+        Runs get_ta_role_for_forum and search_db locally and returns their
+        results as context text, or None when either lookup failed.
+        """
+        if not (self.PREFETCH_CONTEXT and forum_id):
+            return None
+
+        ta_role, knowledge = await asyncio.gather(
+            self.tools.call("get_ta_role_for_forum",
+                            json.dumps({"forum_id": str(forum_id)})),
+            self.tools.call("search_db", json.dumps({"query": message}))
+            if message.strip() else asyncio.sleep(0, result=None),
+        )
+        # The tool returns the bare role ID, "null" or a structured error
+        if not ta_role.isdigit():
+            logger.warning(f"Could not prefetch the TA role for forum {forum_id}")
+            return None
+
+        # search_db reports its own failures as plain "Error..." strings
+        if knowledge is not None and knowledge.startswith(('{"error"', "Error")):
+            logger.warning(f"Could not prefetch search_db results: {knowledge[:200]}")
+            return None
+
+        context = [
+            "Context retrieved before this run (no need to call these tools again):",
+            f"get_ta_role_for_forum({forum_id}) returned ta_role_id: {ta_role}",
+        ]
+        if knowledge:
+            context.append(f"search_db results for the question above:\n{knowledge}")
+        return "\n\n".join(context)
+
+    async def add_message(self, role, content, post_id, files=None, images=None):
         """Adds a message to an OpenAI thread."""
-        if post_id not in self.posts:
+        thread_id = self.posts.get(post_id)
+        if thread_id is None:
             raise ValueError(
                 f"No thread found for post: {post_id}")
 
-        thread_id = self.posts[post_id]
-        attachments = self._prepare_attachments(files)
+        attachments = await self._prepare_attachments(files)
         content = self._prepare_content(content, images)
 
-        self.client.beta.threads.messages.create(
+        await self.client.beta.threads.messages.create(
             thread_id=thread_id,
             role=role,
             content=content,
             attachments=attachments
         )
 
-    def call_required_functions(self, run, required_actions: dict, thread_id):
+    async def call_required_functions(self, run, required_actions: dict, thread_id):
         """
         Handles required tool calls and submits outputs back to the assistant.
         """
-        tool_outputs = []
+        tool_outputs = await self._run_tools(required_actions)
 
-        for action in required_actions.get("tool_calls", []):
-            func_name = action["function"]["name"]
-            args = json.loads(action["function"]["arguments"])
+        if tool_outputs:
+            logger.info("Submitting tool outputs back to the assistant...")
+            await self.client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs
+            )
 
-            logger.info(
-                f"Calling function: {func_name} with arguments: {args}")
+    async def _run_tools(self, required_actions: dict):
+        """
+        Runs the required tool calls and returns their outputs.
 
-            try:
-                if func_name == "fetch_all_code_from_repo":
-                    owner = args["owner"]
-                    repo = args["repo"]
-                    path = args.get("path", "")
-                    output = fetch_all_code_from_repo(owner, repo, path)
-                elif func_name == "extract_owner":
-                    text = args["text"]
-                    output = extract_owner(text)
-                elif func_name == "extract_repo":
-                    text = args["text"]
-                    output = extract_repo(text)
-                elif func_name == "get_ta_role_for_forum":
-                    forum_id = args["forum_id"]
-                    output = get_ta_role_for_forum(forum_id)
-                elif func_name == "search_youtube":
-                    query = args["query"]
-                    output = search_youtube(query)
-                elif func_name == "search_db":
-                    query = args["query"]
-                    k = args.get("k", 5)
-                    output = search_db(query, k)
-                else:
-                    raise ValueError(f"Unknown function: {func_name}")
+        Independent tool calls run concurrently (at most MAX_PARALLEL_TOOLS at
+        a time) and their outputs are returned in the original order.
+        """
+        semaphore = asyncio.Semaphore(self.MAX_PARALLEL_TOOLS)
 
-                tool_outputs.append(
-                    {"tool_call_id": action["id"], "output": output})
+        async def bounded_call(action):
+            async with semaphore:
+                return await self._call_function(action)
 
-            except Exception as e:
-                logger.error(f"Error calling function {func_name}: {e}")
-                tool_outputs.append(
-                    {"tool_call_id": action["id"], "output": f"Error: {e}"}
-                )
+        return list(await asyncio.gather(*(
+            bounded_call(action) for action in required_actions.get("tool_calls", [])
+        )))
 
-        if tool_outputs:
-            logger.info("Submitting tool outputs back to the assistant...")
-            self.client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs
-            )
+    async def _call_function(self, action):
+        """Runs a single tool call and returns its tool output."""
+        output = await self.tools.call(
+            action["function"]["name"], action["function"]["arguments"])
+        return {"tool_call_id": action["id"], "output": output}
 
-    def create_and_run_thread(self, thread):
-        """Creates a run for the thread and processes it."""
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=self.assistant.id,
-            # Force the assistant to use the required tools to get ta_role_id
-            tool_choice="required"
+    async def create_and_run_thread(self, thread, on_text=None, forum_id=None):
+        """
+        Creates a run for the thread and processes it.
+
+        When `on_text` is given the run is streamed and the coroutine is
+        awaited with each text delta as it arrives. `forum_id` selects the
+        question center whose concurrency limit the run counts against.
+        """
+        # Force the assistant to use the required tools to get ta_role_id,
+        # unless the thread already carries the prefetched context
+        prefetched = self.prefetched.pop(thread.id, False)
+        return await self._run(
+            thread.id,
+            on_text,
+            forum_id,
+            tool_choice="auto" if prefetched else "required"
         )
-        return self._handle_run(thread.id, run)
 
-    def extract_response(self, messages):
+    async def _run(self, thread_id, on_text=None, forum_id=None, **params):
+        """
+        Starts a run, streamed when `on_text` is given, and waits for its
+        messages. The run waits for a scheduler slot before it is created.
+        """
+        async with self.scheduler.slot(forum_id):
+            if on_text:
+                stream = await self.client.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=self.assistant.id,
+                    stream=True,
+                    **params
+                )
+                return await self._stream_run(thread_id, stream, on_text)
+
+            run = await self.client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=self.assistant.id,
+                **params
+            )
+            return await self._handle_run(thread_id, run)
+
+    async def extract_response(self, messages):
         """Processes and extracts the assistant's response."""
         if not isinstance(messages, list):
             return messages, None
         message_content = messages[0].content[0].text
         annotations = message_content.annotations
-        citations = set()
-
-        for annotation in annotations:
-            message_content.value = message_content.value.replace(
-                annotation.text, "")
-            if file_citation := getattr(annotation, "file_citation", None):
-                citations.add(
-                    self.client.files.retrieve(file_citation.file_id).filename
-                )
-
-        return message_content.value, list(citations)
 
-    def continue_thread(self, message, post_id, files=None, images=None):
-        """Continues conversation in an OpenAI thread."""
-        self.add_message(
+        # Strip every annotation marker in a single pass over the text
+        markers = {annotation.text for annotation in annotations if annotation.text}
+        if markers:
+            pattern = "|".join(
+                re.escape(marker) for marker in sorted(markers, key=len, reverse=True))
+            message_content.value = re.sub(pattern, "", message_content.value)
+
+        file_ids = {
+            file_citation.file_id
+            for annotation in annotations
+            if (file_citation := getattr(annotation, "file_citation", None))
+        }
+        citations = await asyncio.gather(
+            *(self._get_filename(file_id) for file_id in file_ids))
+
+        return message_content.value, list(set(citations))
+
+    async def _get_filename(self, file_id):
+        """Returns the name of an OpenAI file, cached by file ID."""
+        filename = self.filenames.get(file_id)
+        if filename is None:
+            filename = (await self.client.files.retrieve(file_id)).filename
+            self.filenames.set(file_id, filename)
+        return filename
+
+    async def continue_thread(self, message, post_id, files=None, images=None, on_text=None,
+                              forum_id=None):
+        """Continues conversation in an OpenAI thread, streaming to `on_text` if given."""
+        await self.add_message(
             role="user",
             content=message,
             post_id=post_id,
@@ -398,10 +719,5 @@ class Assistant:
         )
 
         thread_id = self.posts[post_id]
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=self.assistant.id
-        )
-
-        messages = self._handle_run(thread_id, run)
-        return self.extract_response(messages)
+        messages = await self._run(thread_id, on_text, forum_id)
+        return await self.extract_response(messages)
@@ -0,0 +1,114 @@
+"""
+Registry of question centers: the forums the assistant answers in, their TA
+roles and staff channels, plus the watched forums whose unanswered posts are
+escalated to staff.
+
+Centers and watches are loaded from a JSON file (QUESTION_CENTERS_PATH) and
+indexed once per load. The file is re-read when it changes, so new cohorts can be
+onboarded without a deploy.
+"""
+import json
+import os
+import threading
+import time
+from loguru import logger
+
+CENTERS_PATH = os.getenv(
+    "QUESTION_CENTERS_PATH",
+    os.path.join(os.path.dirname(__file__), "config", "question_centers.json")
+)
+
+
+class QuestionCenters:
+    """Immutable snapshot of the centers and watches with precomputed lookups."""
+
+    def __init__(self, centers: dict, watches: dict = None):
+        self.centers = centers
+        self.watches = {
+            watch["forum_id"]: {"name": name, **watch}
+            for name, watch in (watches or {}).items()
+        }
+        self.by_forum = {
+            center["forum_id"]: {"name": name, **center}
+            for name, center in centers.items()
+        }
+        self.forum_ids = frozenset(self.by_forum)
+        self.ta_role_ids = frozenset(center["ta_id"] for center in centers.values())
+        self.staff_channels = {
+            forum_id: center["staff_channel"]
+            for forum_id, center in self.by_forum.items() if "staff_channel" in center
+        }
+
+
+class CenterRegistry:
+    RELOAD_CHECK_INTERVAL = 30  # seconds between checks of the file's mtime
+
+    def __init__(self, path: str = CENTERS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._snapshot = QuestionCenters({})
+        self.reload()
+
+    def reload(self) -> bool:
+        """Re-reads the config file; keeps the previous centers if it is invalid."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, "r") as f:
+                    config = json.load(f)
+                if "centers" in config:
+                    snapshot = QuestionCenters(config["centers"], config.get("watches"))
+                else:  # flat file of centers only
+                    snapshot = QuestionCenters(config)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Could not load question centers from {self.path}: {e}")
+                return False
+
+            self._snapshot = snapshot
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logger.info(f"Loaded question centers: {', '.join(snapshot.centers)}")
+        if snapshot.watches:
+            logger.info(
+                f"Watching forums: {', '.join(watch['name'] for watch in snapshot.watches.values())}")
+        return True
+
+    @property
+    def current(self) -> QuestionCenters:
+        """The latest snapshot, reloaded first if the file changed."""
+        now = time.monotonic()
+        if now - self._checked_at > self.RELOAD_CHECK_INTERVAL:
+            self._checked_at = now
+            try:
+                changed = os.path.getmtime(self.path) != self._mtime
+            except OSError:
+                changed = False
+            if changed:
+                self.reload()
+        return self._snapshot
+
+    @property
+    def forum_ids(self) -> frozenset:
+        return self.current.forum_ids
+
+    def get(self, forum_id: int) -> dict | None:
+        return self.current.by_forum.get(forum_id)
+
+    def ta_role_for(self, forum_id: int) -> int | None:
+        center = self.get(forum_id)
+        return center["ta_id"] if center else None
+
+    def is_ta(self, role_ids) -> bool:
+        return not self.current.ta_role_ids.isdisjoint(role_ids)
+
+    def staff_channel_for(self, forum_id: int) -> int | None:
+        return self.current.staff_channels.get(forum_id)
+
+    def watch_for(self, forum_id: int) -> dict | None:
+        """The unresolved-post watch of a forum: name, staff_channel, mentions, delay (seconds)."""
+        return self.current.watches.get(forum_id)
+
+
+centers = CenterRegistry()
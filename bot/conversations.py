@@ -0,0 +1,81 @@
+"""
+In-process conversation state of Discord forum threads.
+
+The state is kept current from gateway events and from the messages the bot
+sends itself, so follow-up gating does not need to fetch the thread history.
+"""
+import hikari
+from .cache import TTLCache
+
+
+class ThreadState:
+    __slots__ = ("message_count", "bot_replies", "last_author_id", "last_message_id")
+
+    def __init__(self):
+        self.message_count = 0
+        self.bot_replies = 0
+        self.last_author_id = None
+        self.last_message_id = 0
+
+
+class ConversationTracker:
+    def __init__(self, maxsize: int = 4096, ttl: float = 7 * 24 * 60 * 60):
+        self._states = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._held = set()  # threads with a streamed reply in flight
+
+    def get(self, thread_id: int) -> ThreadState | None:
+        return self._states.get(thread_id)
+
+    def seed(self, thread_id: int, history: list[hikari.Message], bot_id: int) -> ThreadState:
+        """Builds the state of a thread from its REST history (newest first)."""
+        state = ThreadState()
+        for message in reversed(history):
+            self._apply(state, message.id, message.author.id, bot_id)
+        self._states.set(thread_id, state)
+        return state
+
+    def observe(self, message: hikari.Message, bot_id: int) -> None:
+        """Records a message of a known thread; unknown threads are seeded lazily."""
+        if message.author.id == bot_id and message.channel_id in self._held:
+            return
+        state = self._states.get(message.channel_id)
+        if state is not None:
+            self._apply(state, message.id, message.author.id, bot_id)
+
+    def hold(self, thread_id: int) -> None:
+        """Stops counting the bot's messages in a thread until the reply is committed or discarded."""
+        self._held.add(thread_id)
+
+    def commit(self, thread_id: int, messages: list[hikari.Message], bot_id: int) -> None:
+        """Counts a streamed reply once it has been delivered."""
+        self._held.discard(thread_id)
+        state = self._states.get(thread_id)
+        if state is None or not messages:
+            return
+        state.message_count += len(messages)
+        if state.last_author_id != bot_id:
+            state.bot_replies += 1
+        newest = max(message.id for message in messages)
+        if newest > state.last_message_id:
+            state.last_author_id = bot_id
+            state.last_message_id = newest
+
+    def discard(self, thread_id: int, message_ids: list[int]) -> None:
+        """Forgets a streamed reply that was deleted; late echoes of it are ignored."""
+        self._held.discard(thread_id)
+        state = self._states.get(thread_id)
+        if state is not None and message_ids:
+            state.last_message_id = max(state.last_message_id, *message_ids)
+
+    @staticmethod
+    def _apply(state: ThreadState, message_id: int, author_id: int, bot_id: int) -> None:
+        # Snowflakes grow over time: anything not newer than the last message
+        # was already counted (e.g. the gateway echo of the bot's own send)
+        if message_id <= state.last_message_id:
+            return
+        state.message_count += 1
+        # Consecutive bot messages (a split answer, the feedback prompt) are one reply
+        if author_id == bot_id and state.last_author_id != bot_id:
+            state.bot_replies += 1
+        state.last_author_id = author_id
+        state.last_message_id = message_id
@@ -0,0 +1,154 @@
+"""
+Registry-driven execution of assistant tool calls.
+
+Tools are registered from `schemas/tool_schemas.json` and resolved to the
+functions of the same name in `bot.tools`. Every call runs in a worker thread
+under a per-tool deadline; a call that misses it is abandoned and the
+assistant receives a structured error instead of the run stalling.
+"""
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from . import tools
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schemas", "tool_schemas.json")
+
+DEFAULT_TIMEOUT = 30  # seconds
+TOOL_TIMEOUTS = {
+    "fetch_all_code_from_repo": 90,
+    "search_db": 20,
+    "search_youtube": 15,
+    "extract_owner": 5,
+    "extract_repo": 5,
+    "get_ta_role_for_forum": 5,
+}
+MAX_OUTPUT_CHARS = 100_000
+TOOL_OUTPUT_CHARS = {
+    # The repository pack already fits itself into REPO_TOKEN_BUDGET (about four
+    # characters per token); leave room for its footers
+    "fetch_all_code_from_repo": max(MAX_OUTPUT_CHARS, tools.REPO_TOKEN_BUDGET * 4 + 10_000),
+}
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+
+class ToolMetrics:
+    """Latency histogram and outcome counters for one tool."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, outcome: str) -> None:
+        with self._lock:
+            self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.calls += 1
+            self.total_seconds += seconds
+            if outcome == "error":
+                self.errors += 1
+            elif outcome == "timeout":
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + ["+Inf"]
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "mean_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+                "histogram": dict(zip(labels, self.buckets)),
+            }
+
+
+class ToolExecutor:
+    def __init__(self, schema_path=SCHEMA_PATH, timeouts=None, max_workers=16,
+                 max_output_chars=MAX_OUTPUT_CHARS):
+        with open(schema_path, "r") as f:
+            schemas = json.load(f)["tools"]
+
+        self.registry = {}  # tool name -> (function, JSON schema of its parameters)
+        for schema in schemas:
+            if schema["type"] != "function":
+                continue
+            name = schema["function"]["name"]
+            func = getattr(tools, name, None)
+            if func is None:
+                logger.warning(f"No implementation found for tool: {name}")
+                continue
+            self.registry[name] = (func, schema["function"].get("parameters", {}))
+
+        self.timeouts = {**TOOL_TIMEOUTS, **(timeouts or {})}
+        self.max_output_chars = max_output_chars
+        self.metrics = {name: ToolMetrics() for name in self.registry}
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool")
+
+    def _parse_arguments(self, name: str, arguments: str) -> dict:
+        """Decodes the model's arguments and keeps only the declared parameters."""
+        parameters = self.registry[name][1]
+        args = json.loads(arguments or "{}")
+        missing = [key for key in parameters.get("required", []) if key not in args]
+        if missing:
+            raise ValueError(f"Missing required arguments: {', '.join(missing)}")
+        properties = parameters.get("properties", {})
+        return {key: value for key, value in args.items() if key in properties}
+
+    def _format_output(self, name: str, output) -> str:
+        if not isinstance(output, str):
+            output = json.dumps(output)
+        limit = max(self.max_output_chars, TOOL_OUTPUT_CHARS.get(name, 0))
+        if len(output) > limit:
+            dropped = len(output) - limit
+            output = output[:limit] + \
+                f"\n... [output truncated, {dropped} characters dropped]"
+        return output
+
+    @staticmethod
+    def _error(name: str, kind: str, message: str) -> str:
+        return json.dumps({"error": {"tool": name, "type": kind, "message": message}})
+
+    async def call(self, name: str, arguments: str) -> str:
+        """Runs a tool under its deadline and always returns a string output."""
+        if name not in self.registry:
+            logger.error(f"Unknown function: {name}")
+            return self._error(name, "unknown_tool", f"Unknown function: {name}")
+
+        timeout = self.timeouts.get(name, DEFAULT_TIMEOUT)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            kwargs = self._parse_arguments(name, arguments)
+            logger.info(f"Calling function: {name} with arguments: {kwargs}")
+
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._pool, functools.partial(self.registry[name][0], **kwargs))
+            # On timeout the worker thread is abandoned, not killed
+            output = await asyncio.wait_for(future, timeout)
+            return self._format_output(name, output)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.error(f"Function {name} timed out after {timeout}s")
+            return self._error(name, "timeout", f"The tool did not finish within {timeout} seconds.")
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Error calling function {name}: {e}")
+            return self._error(name, type(e).__name__, str(e))
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics[name].observe(elapsed, outcome)
+            logger.info(f"Function {name} finished ({outcome}) in {elapsed:.2f}s")
+
+    def stats(self) -> dict:
+        """Returns latency histograms and error counts per tool."""
+        return {name: metrics.snapshot() for name, metrics in self.metrics.items()}
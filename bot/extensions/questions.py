@@ -1,22 +1,28 @@
 import hikari
 import lightbulb
 from ..agent import Assistant
+from ..centers import centers
+from ..cache import TTLCache
+from ..conversations import ConversationTracker
+from ..feedback import FeedbackDigest
+from ..streaming import ReplyStream, send_reply
+from ..timers import DeadlineTimers
 from loguru import logger
 import os
 import asyncio
-from bot.helpers import today, yesterday
+import time
 
-
-QUESTION_CENTERS = {
-    "DS": {"forum_id": 1081063200377806899, "ta_id": 1194665960376901773, "staff_channel": 1237424754739253279},
-    "FSW": {"forum_id": 1077118780523679787, "ta_id": 912553106124972083},
-    "CS50": {"forum_id": 1318582941667819683, "ta_id": 1233260164233297942},
-    "DSTEST": {"forum_id": 1371374712487149578, "ta_id": 1194665960376901773}
-    # "SAI": {"forum_id": 1363565155002093600, "ta_id": 1266313334261809184},
-    # "MOENASH": {"forum_id": 1344962762887004160, "ta_id": 947046253609508945},
-}
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
+FEEDBACK_CHANNEL = 1237424754739253279  # DS staff-internal, for forums without a staff channel
+RATING_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]
 
 plugin = lightbulb.Plugin("Q&A", "🙋‍♂️ Question Center")
+conversations = ConversationTracker()
+forum_tags: dict[int, dict[int, str]] = {}  # forum ID -> {tag ID: tag name}
+unresolved = DeadlineTimers()
+feedback = FeedbackDigest()
+user_names = TTLCache(maxsize=4096, ttl=24 * 60 * 60)  # user ID -> display name
+responding: set[int] = set()  # posts the bot is currently answering
 
 
 def load(bot: lightbulb.BotApp) -> None:
@@ -27,14 +33,92 @@ def load(bot: lightbulb.BotApp) -> None:
 async def on_starting(event: hikari.StartingEvent) -> None:
     bot = Assistant(
         [f"docs/{filename}" for filename in os.listdir('docs')])
+    await bot.start()
     plugin.app.d.bot = bot
 
 
+async def get_forum_tags(forum_id: int) -> dict[int, str]:
+    """Returns the tag names of a forum, fetching it only on a cache miss."""
+    if forum_id not in forum_tags:
+        forum = await plugin.app.rest.fetch_channel(forum_id)
+        forum_tags[forum_id] = {
+            tag.id: tag.name for tag in forum.available_tags
+        }
+    return forum_tags[forum_id]
+
+
+@plugin.listener(hikari.GuildChannelUpdateEvent)
+async def on_channel_update(event: hikari.GuildChannelUpdateEvent) -> None:
+    """Keep the cached forum tags in sync when a question forum is edited."""
+    if event.channel_id in centers.forum_ids and isinstance(event.channel, hikari.GuildForumChannel):
+        forum_tags[event.channel_id] = {
+            tag.id: tag.name for tag in event.channel.available_tags
+        }
+
+
 @plugin.listener(hikari.StartedEvent)
 async def on_started(event: hikari.StartedEvent) -> None:
-    # Found question in SAIGAME, notify in FSW
-    asyncio.create_task(check_threads(
-        1266295106139328522, 1266296401516564551, 1239620442835259424))
+    # Warm the forum metadata cache
+    for forum_id in centers.forum_ids:
+        try:
+            await get_forum_tags(forum_id)
+        except hikari.HTTPError as e:
+            logger.error(f"Could not fetch forum {forum_id}: {e}")
+
+    asyncio.create_task(unresolved.run(notify_unresolved))
+    asyncio.create_task(feedback.run(plugin.app.rest.create_message))
+
+
+@plugin.listener(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent) -> None:
+    # Send the ratings collected since the last digest before shutting down
+    try:
+        await feedback.flush(plugin.app.rest.create_message)
+    except Exception as e:
+        logger.error(f"Could not send feedback digest on shutdown: {e}")
+
+
+async def send_answer(post: hikari.GuildThreadChannel, get_response) -> list[hikari.Message] | None:
+    """
+    Runs `get_response(on_text)` and posts the answer, streamed progressively
+    when STREAM_REPLIES is on. Returns None when the post is already answered.
+    """
+    bot_id = plugin.app.get_me().id
+    # Double check if bot is the author of the last message (server causes bot to respond twice)
+    state = conversations.get(post.id)
+    if post.id in responding or (state and state.last_author_id == bot_id):
+        return None
+
+    responding.add(post.id)
+    try:
+        if STREAM_REPLIES:
+            # The reply only counts once delivered, so a failed run leaves the
+            # learner free to ask again
+            conversations.hold(post.id)
+            stream = ReplyStream(post)
+            try:
+                await stream.start()
+                response, citations = await get_response(stream.write)
+                sent = await stream.finish(response)
+            except BaseException:
+                deleted = []
+                try:
+                    deleted = await stream.abort()
+                finally:
+                    conversations.discard(post.id, deleted)
+                raise
+            conversations.commit(post.id, sent, bot_id)
+        else:
+            response, citations = await get_response(None)
+            sent = await send_reply(post, response)
+            for message in sent:
+                conversations.observe(message, bot_id)
+    finally:
+        responding.discard(post.id)
+
+    if citations:
+        logger.info(f"Referenced files: {', '.join(citations)}")
+    return sent
 
 
 async def handle_post_creation(post: hikari.GuildThreadChannel, message: hikari.Message) -> None:
@@ -45,7 +129,7 @@ async def handle_post_creation(post: hikari.GuildThreadChannel, message: hikari.
 
     try:
         bot = plugin.app.d.bot
-        thread = bot.create_thread(
+        thread = await bot.create_thread(
             message=message.content,
             images=images,
             files=files,
@@ -54,12 +138,12 @@ async def handle_post_creation(post: hikari.GuildThreadChannel, message: hikari.
         bot.posts[post.id] = thread.id
         logger.info(f"Created thread for post: {post.name}")
 
-        messages = bot.create_and_run_thread(thread)
-        response, citations = bot.extract_response(messages)
-        await post.send(response)
+        async def get_response(on_text):
+            messages = await bot.create_and_run_thread(
+                thread, on_text=on_text, forum_id=post.parent_id)
+            return await bot.extract_response(messages)
 
-        if citations:
-            logger.info(f"Referenced files: {', '.join(citations)}")
+        await send_answer(post, get_response)
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
@@ -68,7 +152,7 @@ async def handle_post_creation(post: hikari.GuildThreadChannel, message: hikari.
 @plugin.listener(hikari.GuildThreadCreateEvent)
 async def on_thread_create_cs50(event: hikari.GuildThreadCreateEvent) -> None:
     """Replicate thread creation in the CS50 forum (batch 3, 4) to clone forum"""
-    thread: hikari.GuildThreadChannel = await event.fetch_channel()
+    thread: hikari.GuildThreadChannel = event.thread
 
     if thread.parent_id in [1318582941667819683, 1287676502196092928]:
         messages = await thread.fetch_history()
@@ -85,18 +169,30 @@ async def on_thread_create_cs50(event: hikari.GuildThreadCreateEvent) -> None:
             )
 
 
+@plugin.listener(hikari.GuildThreadCreateEvent)
+async def on_thread_create_watch(event: hikari.GuildThreadCreateEvent) -> None:
+    """Arm the unresolved-post timer for threads in watched forums"""
+    thread = event.thread
+    watch = centers.watch_for(thread.parent_id)
+    if watch and unresolved.get(str(thread.id)) is None:
+        unresolved.arm(
+            str(thread.id),
+            time.time() + watch["delay"],
+            {"forum_id": thread.parent_id, "owner_id": thread.owner_id}
+        )
+
+
 @plugin.listener(hikari.GuildThreadCreateEvent)
 async def on_thread_create(event: hikari.GuildThreadCreateEvent) -> None:
-    post = await event.fetch_channel()
+    post = event.thread
 
-    forum = await event.app.rest.fetch_channel(post.parent_id)
-    tags = {
-        tag.id: tag.name for tag in forum.available_tags
-    }
-    if post.parent_id in [guild["forum_id"] for guild in QUESTION_CENTERS.values()]:
+    if post.parent_id in centers.forum_ids:
+        tags = await get_forum_tags(post.parent_id)
         messages = await post.fetch_history()
+        conversations.seed(post.id, messages, plugin.app.get_me().id)
         if messages:
-            tag_name = tags.get(post.applied_tag_ids[0], "Unknown")
+            tag_id = post.applied_tag_ids[0] if post.applied_tag_ids else None
+            tag_name = tags.get(tag_id, "Unknown")
             logger.info(f"Thread created with tag: {tag_name}")
 
             if tag_name == "Code review":
@@ -114,120 +210,131 @@ async def on_thread_create(event: hikari.GuildThreadCreateEvent) -> None:
 
 async def handle_follow_up(post: hikari.GuildThreadChannel, message: hikari.Message) -> None:
     bot = plugin.app.d.bot
+    bot_id = plugin.app.get_me().id
     images = [
         att.url for att in message.attachments if att.media_type.startswith("image")]
     files = [
         att.url for att in message.attachments if not att.media_type.startswith("image")]
-    response, citations = bot.continue_thread(
-        message.content,
-        post.id,
-        files=files,
-        images=images
-    )
 
-    # Double check if bot is the author of the last message (server causes bot to respond twice)
-    history = await post.fetch_history()
-    if history and history[0].author.id == plugin.app.get_me().id:
-        return
-    await post.send(response)
+    async def get_response(on_text):
+        return await bot.continue_thread(
+            message.content,
+            post.id,
+            files=files,
+            images=images,
+            on_text=on_text,
+            forum_id=post.parent_id
+        )
 
-    if citations:
-        logger.info(f"Referenced files: {', '.join(citations)}")
+    if await send_answer(post, get_response) is None:
+        return
 
     feedback_message = await post.send(
         f"{message.author.mention} Thanks for your question! How would you rate my response from 1 to 5?\n Your feedback is greatly appreciated! 😊"
     )
+    conversations.observe(feedback_message, bot_id)
+    feedback.track(
+        feedback_message.id,
+        post.guild_id,
+        post.id,
+        centers.staff_channel_for(post.parent_id) or FEEDBACK_CHANNEL
+    )
 
-    emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]
-    for emoji in emojis:
+    for emoji in RATING_EMOJIS:
         await feedback_message.add_reaction(emoji)
 
 
 @plugin.listener(hikari.GuildMessageCreateEvent)
 async def on_message_create(event: hikari.GuildMessageCreateEvent) -> None:
     message = event.message
+    bot_id = plugin.app.get_me().id
+    conversations.observe(message, bot_id)
+
+    # The first reply from anyone but the author resolves a watched post
+    timer = unresolved.get(str(message.channel_id))
+    if timer and message.author.id != timer["owner_id"]:
+        unresolved.cancel(str(message.channel_id))
     if message.author.is_bot:
         return
 
     try:
-        thread: hikari.GuildThreadChannel = await message.fetch_channel()
-        if thread.parent_id not in [guild["forum_id"] for guild in QUESTION_CENTERS.values()]:
+        thread = plugin.app.cache.get_thread(message.channel_id)
+        if thread is None:
+            thread = await message.fetch_channel()
+        if not isinstance(thread, hikari.GuildThreadChannel):
+            return
+        if thread.parent_id not in centers.forum_ids:
             return
 
-        for center in QUESTION_CENTERS.values():
-            if center['ta_id'] in message.member.role_ids:
-                logger.info(
-                    f"TA message detected in {thread.name}, skipping response")
-                return
+        if centers.is_ta(message.member.role_ids):
+            logger.info(
+                f"TA message detected in {thread.name}, skipping response")
+            return
+
+        state = conversations.get(thread.id)
+        if state is None:
+            # Unknown thread (e.g. after a restart): seed once from REST,
+            # the history already contains this message
+            state = conversations.seed(
+                thread.id, await thread.fetch_history(), bot_id)
 
-        if len(await thread.fetch_history()) <= 1:
+        if state.message_count <= 1:
             return
-        if len([msg for msg in await thread.fetch_history() if msg.author.id == plugin.app.get_me().id]) == 1:
+        if state.bot_replies == 1:
             await handle_follow_up(thread, message)
-        elif len([msg for msg in await thread.fetch_history() if msg.author.id == plugin.app.get_me().id]) >= 2:
+        elif state.bot_replies >= 2:
             logger.info(f"2 responses found, stop follow-up {thread.name}")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
 
 
-@plugin.listener(hikari.ReactionAddEvent)
-async def on_reaction_add(event: hikari.ReactionAddEvent) -> None:
+@plugin.listener(hikari.GuildReactionAddEvent)
+async def on_reaction_add(event: hikari.GuildReactionAddEvent) -> None:
+    if event.emoji_name not in RATING_EMOJIS or not feedback.is_feedback(event.message_id):
+        return
     if event.user_id == plugin.app.get_me().id:
         return
 
-    if event.emoji_name in ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]:
-        thread = await plugin.app.rest.fetch_channel(event.channel_id)
-        score = event.emoji_name[0]
-        user = await plugin.app.rest.fetch_user(event.user_id)
-        thread_link = f"https://discord.com/channels/{thread.guild_id}/{thread.id}"
-        logger.info(
-            f"User {user.display_name} rated the response with {event.emoji_name}")
-        await plugin.app.rest.create_message(
-            1237424754739253279,  # DS staff-internal
-            f"`{user.display_name}` rated the response with a score of {score} in thread {thread_link}"
-        )
+    user_name = event.member.display_name if event.member else user_names.get(event.user_id)
+    if user_name is None:
+        user_name = (await plugin.app.rest.fetch_user(event.user_id)).display_name
+    user_names.set(event.user_id, user_name)
+
+    logger.info(
+        f"User {user_name} rated the response with {event.emoji_name}")
+    feedback.add(event.message_id, event.user_id, user_name, int(event.emoji_name[0]))
 
 
-async def check_threads(
-    guild: int,
-    forum_channel: int,
-    staff_channel: int
-):
-    CHECK_INTERVAL = 2000
-    while True:
-        await asyncio.sleep(CHECK_INTERVAL)
-        threads = [
-            thread for thread in await plugin.app.rest.fetch_active_threads(guild)
-            if isinstance(thread, hikari.GuildThreadChannel) and
-            thread.parent_id == forum_channel and
-            thread.created_at.date() in [today(), yesterday()]
-        ]
-        for thread in threads:
-            messages: list[hikari.Message] = await thread.fetch_history()
-            members = {message.author.id for message in messages}
-            if len(members) <= 1:
-                author = await plugin.app.rest.fetch_member(guild, thread.owner_id)
-                attachments = [att.url for att in messages[0].attachments]
-
-                embed = hikari.Embed(
-                    title=thread.name,
-                    description=messages[0].content,
-                    color="#118ab2",
-                    url=f"https://discord.com/channels/{thread.guild_id}/{thread.id}"
-                ).set_footer(
-                    text=f"Posted by {author.global_name}",
-                    icon=author.avatar_url
-                )
-
-                if attachments:
-                    embed.set_image(attachments[0])
-
-                # Notify TA Quang and Hien
-                await plugin.app.rest.create_message(
-                    staff_channel,
-                    content=(
-                        f"<@{507770826733518859}> "
-                        f"<@{581363593468182528}> "
-                        "this thread in SAIGAME remains unresolved for more than 15min"),
-                    embed=embed
-                )
+async def notify_unresolved(thread_id: str, timer: dict) -> None:
+    """Tell staff that a watched post got no reply before its deadline."""
+    watch = centers.watch_for(timer["forum_id"])
+    if watch is None:
+        return
+
+    thread = await plugin.app.rest.fetch_channel(int(thread_id))
+    # The starter message of a forum post shares the post's ID
+    message = await plugin.app.rest.fetch_message(thread.id, thread.id)
+    author = await plugin.app.rest.fetch_member(thread.guild_id, timer["owner_id"])
+    attachments = [att.url for att in message.attachments]
+
+    embed = hikari.Embed(
+        title=thread.name,
+        description=message.content,
+        color="#118ab2",
+        url=f"https://discord.com/channels/{thread.guild_id}/{thread.id}"
+    ).set_footer(
+        text=f"Posted by {author.global_name}",
+        icon=author.avatar_url
+    )
+
+    if attachments:
+        embed.set_image(attachments[0])
+
+    mentions = " ".join(f"<@{user_id}>" for user_id in watch["mentions"])
+    await plugin.app.rest.create_message(
+        watch["staff_channel"],
+        content=(
+            f"{mentions} "
+            f"this thread in {watch['name']} remains unresolved for more than {watch['delay'] // 60}min"),
+        embed=embed
+    )
@@ -0,0 +1,156 @@
+"""
+Batched pipeline for the 1-5 ratings learners leave on the bot's answers.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from loguru import logger
+from .cache import TTLCache
+from .store import connect
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+class FeedbackDigest:
+    """
+    Collects ratings on known feedback messages and sends them to staff as
+    periodic digests instead of one message per reaction.
+
+    A user's repeated reactions on the same message are coalesced (the last
+    rating wins) and a rating already reported is not reported again.
+    Feedback messages are persisted for `max_age_days`, so ratings on prompts
+    sent before a restart are still collected.
+    """
+
+    def __init__(self, interval: float = 10 * 60, flush_size: int = 50,
+                 max_pending: int = 500, db_name: str = "feedback.sqlite3",
+                 max_age_days: int = 14):
+        self.interval = interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self.max_age = max_age_days * 24 * 60 * 60
+        # feedback message ID -> {"guild_id", "thread_id", "staff_channel"}
+        self._messages = TTLCache(maxsize=10_000, ttl=self.max_age)
+        self._reported = TTLCache(maxsize=10_000, ttl=self.max_age)
+        self._pending = OrderedDict()  # (message ID, user ID) -> rating
+        self._flush_now = asyncio.Event()
+        self._lock = threading.Lock()
+        self._conn = connect(db_name)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_messages ("
+                "message_id TEXT PRIMARY KEY, guild_id TEXT NOT NULL, thread_id TEXT NOT NULL, "
+                "staff_channel TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "DELETE FROM feedback_messages WHERE created_at < ?", (time.time() - self.max_age,)
+            )
+
+    def track(self, message_id: int, guild_id: int, thread_id: int, staff_channel: int) -> None:
+        """Registers a feedback message sent by the bot."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO feedback_messages "
+                "(message_id, guild_id, thread_id, staff_channel, created_at) VALUES (?, ?, ?, ?, ?)",
+                (str(message_id), str(guild_id), str(thread_id), str(staff_channel), time.time())
+            )
+        self._messages.set(message_id, {
+            "guild_id": guild_id, "thread_id": thread_id, "staff_channel": staff_channel,
+        })
+
+    def _lookup(self, message_id: int) -> dict | None:
+        feedback = self._messages.get(message_id)
+        if feedback is not None:
+            return feedback
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT guild_id, thread_id, staff_channel FROM feedback_messages "
+                "WHERE message_id = ? AND created_at >= ?",
+                (str(message_id), time.time() - self.max_age)
+            ).fetchone()
+        if row is None:
+            return None
+        feedback = dict(zip(("guild_id", "thread_id", "staff_channel"), map(int, row)))
+        self._messages.set(message_id, feedback)
+        return feedback
+
+    def is_feedback(self, message_id: int) -> bool:
+        return self._lookup(message_id) is not None
+
+    def add(self, message_id: int, user_id: int, user_name: str, score: int) -> None:
+        feedback = self._lookup(message_id)
+        key = (message_id, user_id)
+        if feedback is None or self._reported.get(key) == score:
+            return
+
+        self._pending.pop(key, None)
+        self._pending[key] = {"user_name": user_name, "score": score, **feedback}
+        if len(self._pending) > self.max_pending:
+            dropped, _ = self._pending.popitem(last=False)
+            logger.warning(f"Feedback queue full, dropped rating {dropped}")
+        if len(self._pending) >= self.flush_size:
+            self._flush_now.set()
+
+    async def run(self, send) -> None:
+        """Flushes digests forever through `send(channel_id, content)`."""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush(send)
+            except Exception as e:
+                logger.error(f"Could not send feedback digest: {e}")
+
+    async def flush(self, send) -> None:
+        """
+        Sends the pending ratings, grouped per staff channel. Ratings count as
+        reported only once the message carrying them was sent; the rest are
+        queued again for the next flush.
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        by_channel = {}
+        for key, rating in pending.items():
+            thread_link = f"https://discord.com/channels/{rating['guild_id']}/{rating['thread_id']}"
+            by_channel.setdefault(rating["staff_channel"], []).append((
+                key,
+                f"- `{rating['user_name']}` rated the response with a score of {rating['score']} in thread {thread_link}"
+            ))
+
+        for channel_id, entries in by_channel.items():
+            logger.info(f"Sending digest of {len(entries)} ratings to {channel_id}")
+            # Split into Discord-sized messages, each with the ratings it carries
+            chunks = []
+            content, keys = f"**Feedback digest** ({len(entries)} ratings)", []
+            for key, line in entries:
+                if len(content) + len(line) + 1 > DISCORD_MESSAGE_LIMIT:
+                    chunks.append((content, keys))
+                    content, keys = "", []
+                content = f"{content}\n{line}" if content else line
+                keys.append(key)
+            chunks.append((content, keys))
+
+            for i, (content, keys) in enumerate(chunks):
+                try:
+                    await send(channel_id, content)
+                except Exception as e:
+                    unsent = [key for _, chunk_keys in chunks[i:] for key in chunk_keys]
+                    logger.error(
+                        f"Could not send feedback digest to {channel_id}, "
+                        f"requeueing {len(unsent)} ratings: {e}")
+                    self._requeue({key: pending[key] for key in unsent})
+                    break
+                for key in keys:
+                    self._reported.set(key, pending[key]["score"])
+
+    def _requeue(self, ratings: dict) -> None:
+        """Puts unsent ratings back in front of the queue; newer ratings of the same user win."""
+        merged = OrderedDict((key, rating) for key, rating in ratings.items() if key not in self._pending)
+        merged.update(self._pending)
+        while len(merged) > self.max_pending:
+            dropped, _ = merged.popitem(last=False)
+            logger.warning(f"Feedback queue full, dropped rating {dropped}")
+        self._pending = merged
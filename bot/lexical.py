@@ -0,0 +1,134 @@
+"""
+In-memory BM25 index over the same chunks as the Chroma vector store.
+
+Learner questions often hinge on exact tokens (module codes such as M11,
+exam question numbers, function names) that embeddings match poorly. The
+index answers those directly and otherwise contributes a second ranking that
+`search_db` fuses with the vector results.
+"""
+import math
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9_]+")
+_EXACT_TOKEN = re.compile(r"\d|_|[a-z][A-Z]|\(\)")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the",
+    "this", "to", "what", "when", "where", "which", "why", "with", "you",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens; keeps digits and identifiers such as m11 or read_csv."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def exact_terms(query: str) -> set[str]:
+    """Query terms that have to match literally: numbers, codes and identifiers."""
+    terms = set()
+    for word in re.findall(r"[\w()]+", query):
+        if _EXACT_TOKEN.search(word):
+            terms.update(tokenize(word))
+    return terms
+
+
+class LexicalIndex:
+    """
+    BM25 index with postings stored as parallel arrays of chunk numbers and term frequencies.
+
+    Built once per vector store version from `vector_store.get()`; read-only afterwards.
+    """
+
+    def __init__(self, ids: list[str], texts: list[str], metadatas: list[dict]):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.positions = {chunk_id: doc_number for doc_number, chunk_id in enumerate(ids)}
+        self.lengths = array("I")
+        postings = defaultdict(lambda: (array("I"), array("H")))
+
+        for doc_number, (text, metadata) in enumerate(zip(texts, metadatas)):
+            # The source name carries the module code (docs/M11.txt)
+            source = os.path.splitext(os.path.basename(str((metadata or {}).get("source", ""))))[0]
+            counts = Counter(tokenize(f"{source} {text}"))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                doc_numbers, tfs = postings[term]
+                doc_numbers.append(doc_number)
+                tfs.append(min(tf, 0xFFFF))
+
+        self.postings = dict(postings)
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    @classmethod
+    def from_vector_store(cls, vector_store) -> "LexicalIndex":
+        data = vector_store.get(include=["documents", "metadatas"])
+        return cls(data["ids"], data["documents"], data["metadatas"])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.postings
+
+    def search(self, query: str, k: int = 5) -> list[tuple[str, float]]:
+        """Returns up to k (chunk id, BM25 score) pairs, best first."""
+        if not self.ids:
+            return []
+        scores = defaultdict(float)
+        total = len(self.ids)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            doc_numbers, tfs = self.postings[term]
+            idf = math.log(1 + (total - len(doc_numbers) + 0.5) / (len(doc_numbers) + 0.5))
+            for doc_number, tf in zip(doc_numbers, tfs):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_number] / self.avg_length)
+                scores[doc_number] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc_number], score) for doc_number, score in best]
+
+    def document(self, chunk_id: str) -> Document:
+        doc_number = self.positions[chunk_id]
+        return Document(page_content=self.texts[doc_number], metadata=self.metadatas[doc_number] or {})
+
+    def has_term(self, chunk_id: str, term: str) -> bool:
+        if term not in self.postings:
+            return False
+        doc_numbers = self.postings[term][0]
+        position = bisect_left(doc_numbers, self.positions[chunk_id])
+        return position < len(doc_numbers) and doc_numbers[position] == self.positions[chunk_id]
+
+    def is_confident(self, query: str, results: list[tuple[str, float]],
+                     margin: float = 1.3) -> bool:
+        """
+        Whether the lexical results alone are good enough to skip the embedding call:
+        the query has exact tokens, the best hit contains all of them, and it
+        scores clearly ahead of the runner-up.
+        """
+        terms = exact_terms(query)
+        if not results or not terms:
+            return False
+        best_id, top = results[0]
+        if not all(self.has_term(best_id, term) for term in terms):
+            return False
+        runner_up = results[1][1] if len(results) > 1 else 0.0
+        return top >= margin * runner_up
+
+
+def reciprocal_rank_fusion(*rankings: list[str], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Fuses ranked id lists; each id scores the sum of 1 / (k + rank) over the lists."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
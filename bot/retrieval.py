@@ -0,0 +1,83 @@
+"""
+Process-wide registry for the Chroma vector store used by the retrieval tools.
+
+The store is opened once and shared by every `search_db` call instead of
+building a new embedding client and Chroma connection per tool call.
+"""
+import os
+import threading
+from loguru import logger
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings
+from .cache import CachedEmbeddings
+from .lexical import LexicalIndex
+
+CHROMA_PATH = "chroma"
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+_lock = threading.RLock()
+_vector_store = None
+_version = 0
+_embedding_function = None
+_lexical_index = None
+_lexical_version = None
+
+
+def get_embedding_function():
+    """Returns the cached embedding function shared by ingestion and queries."""
+    global _embedding_function
+    with _lock:
+        if _embedding_function is None:
+            _embedding_function = CachedEmbeddings(
+                OpenAIEmbeddings(model=EMBEDDING_MODEL), model=EMBEDDING_MODEL)
+        return _embedding_function
+
+
+def set_vector_store(vector_store) -> None:
+    """Registers the shared vector store and bumps the index version."""
+    global _vector_store, _version
+    with _lock:
+        _vector_store = vector_store
+        _version += 1
+    logger.info(f"Vector store registered (version {_version})")
+
+
+def reload_vector_store(persist_directory: str = CHROMA_PATH):
+    """Re-opens the persisted vector store, e.g. after the index was rebuilt."""
+    if not os.path.exists(persist_directory):
+        logger.error(f"Chroma DB path {persist_directory} does not exist")
+        return None
+
+    vector_store = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=get_embedding_function()
+    )
+    set_vector_store(vector_store)
+    return vector_store
+
+
+def get_vector_store():
+    """Returns the shared vector store, opening the persisted one on first use."""
+    with _lock:
+        if _vector_store is not None:
+            return _vector_store
+        return reload_vector_store()
+
+
+def get_version() -> int:
+    """Returns a counter that changes every time the index is replaced or updated."""
+    return _version
+
+
+def get_lexical_index():
+    """Returns the BM25 index over the current vector store, rebuilding it when the store changes."""
+    global _lexical_index, _lexical_version
+    vector_store = get_vector_store()
+    if vector_store is None:
+        return None
+    with _lock:
+        if _lexical_version != _version:
+            _lexical_index = LexicalIndex.from_vector_store(vector_store)
+            _lexical_version = _version
+            logger.info(f"Lexical index built over {len(_lexical_index)} chunks (version {_version})")
+        return _lexical_index
@@ -0,0 +1,301 @@
+"""
+Shared retry policy for outbound HTTP calls.
+
+One policy covers OpenAI (through a transport for the SDK's HTTP client) and GitHub/YouTube
+(through a requests adapter): jittered exponential backoff that honours
+Retry-After and x-ratelimit-reset headers, a retry budget and a circuit
+breaker per endpoint (method, host and path template), and counters of how often each of them fires.
+"""
+import asyncio
+import importlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+import requests
+from loguru import logger
+from openai import DefaultAsyncHttpxClient
+from requests.adapters import HTTPAdapter
+
+# The HTTP library behind the OpenAI SDK's client: httpx in older releases,
+# its httpx2 fork in newer ones. The transport must be built on the same one.
+_sdk_http = importlib.import_module(next(
+    cls for cls in DefaultAsyncHttpxClient.__mro__ if cls.__name__ == "AsyncClient"
+).__module__.split(".")[0])
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float | None:
+    """Parses OpenAI reset durations such as "1s", "6m0s" or "120ms" into seconds."""
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+def is_retryable(status: int, headers) -> bool:
+    if status in RETRY_STATUSES:
+        return True
+    # GitHub signals primary and secondary rate limits with a 403
+    return status == 403 and (
+        headers.get("x-ratelimit-remaining") == "0" or "retry-after" in headers)
+
+
+_VERSION_SEGMENT = re.compile(r"v\d+")
+_ID_SEGMENT = re.compile(r"[a-z]+[_-][A-Za-z0-9]{8,}|.*\d.*")
+
+
+def endpoint_key(method: str, host: str, path: str) -> str:
+    """
+    Groups requests into endpoints such as "POST api.openai.com/v1/threads/{id}/runs",
+    so a failing route does not trip the breaker of unrelated ones on the same host.
+    """
+    segments = [segment for segment in path.split("/") if segment]
+    for i, segment in enumerate(segments):
+        if i in (1, 2) and segments[0] == "repos":  # GitHub /repos/{owner}/{repo}
+            segments[i] = "{owner}" if i == 1 else "{repo}"
+        elif not _VERSION_SEGMENT.fullmatch(segment) and _ID_SEGMENT.fullmatch(segment):
+            segments[i] = "{id}"
+    return f"{method} {host}/{'/'.join(segments)}"
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 max_server_wait: float = 60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_server_wait = max_server_wait  # longer server-requested waits are not retried
+
+    def delay(self, attempt: int, headers=None) -> float | None:
+        """Seconds to wait before retry `attempt` (0-based), or None to give up."""
+        server_wait = self._server_wait(headers) if headers is not None else None
+        if server_wait is not None:
+            return server_wait if server_wait <= self.max_server_wait else None
+        # Full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _server_wait(headers) -> float | None:
+        if retry_after := headers.get("retry-after"):
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        # GitHub sends the hourly window's reset on every response; it only
+        # matters once the window is exhausted
+        reset = headers.get("x-ratelimit-reset")
+        if reset and headers.get("x-ratelimit-remaining") == "0":  # epoch seconds
+            try:
+                return max(float(reset) - time.time(), 0.0)
+            except ValueError:
+                pass
+        waits = [
+            parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            for kind in ("requests", "tokens")
+            if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+        ]
+        waits = [wait for wait in waits if wait is not None]
+        return max(waits) if waits else None
+
+
+class RetryBudget:
+    """Allows retries for at most `ratio` of the requests made, plus a small reserve."""
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = reserve
+
+    def on_request(self) -> None:
+        self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets one probe through per `cooldown`."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            self.opened_at = time.monotonic()  # half-open: one probe per cooldown
+            return True
+        return False
+
+    def record(self, success: bool) -> None:
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class Retrier:
+    """Per-endpoint budgets, breakers and metrics shared by every transport."""
+
+    def __init__(self, policy: RetryPolicy = None):
+        self.policy = policy or RetryPolicy()
+        self.metrics = Counter()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def state(self, endpoint: str) -> tuple[RetryBudget, CircuitBreaker]:
+        with self._lock:
+            if endpoint not in self._endpoints:
+                self._endpoints[endpoint] = (RetryBudget(), CircuitBreaker())
+            return self._endpoints[endpoint]
+
+    def begin(self, endpoint: str) -> bool:
+        """Registers a request attempt; False when the endpoint's circuit is open."""
+        budget, breaker = self.state(endpoint)
+        with self._lock:
+            if not breaker.allow():
+                self.metrics[(endpoint, "circuit_open")] += 1
+                return False
+            budget.on_request()
+            return True
+
+    def next_delay(self, endpoint: str, attempt: int, status: int = None,
+                   headers=None) -> float | None:
+        """
+        Records a failed attempt and returns how long to wait before retrying, or None.
+
+        Only server errors and connection failures (`status` None) count toward
+        the circuit breaker; rate limiting means the endpoint is healthy but busy.
+        """
+        budget, breaker = self.state(endpoint)
+        with self._lock:
+            if status is None or status >= 500:
+                breaker.record(success=False)
+            if attempt + 1 >= self.policy.max_attempts:
+                self.metrics[(endpoint, "gave_up")] += 1
+                return None
+            delay = self.policy.delay(attempt, headers)
+            if delay is None:
+                self.metrics[(endpoint, "gave_up")] += 1
+                return None
+            if not budget.try_spend():
+                self.metrics[(endpoint, "budget_exhausted")] += 1
+                return None
+            self.metrics[(endpoint, "retry")] += 1
+        logger.warning(
+            f"Retrying {endpoint} (attempt {attempt + 2}, status {status}) in {delay:.1f}s")
+        return delay
+
+    def succeeded(self, endpoint: str) -> None:
+        _, breaker = self.state(endpoint)
+        with self._lock:
+            breaker.record(success=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                f"{endpoint}:{event}": count for (endpoint, event), count in self.metrics.items()
+            }
+
+
+retrier = Retrier()
+
+
+class RetryTransport(_sdk_http.AsyncHTTPTransport):
+    """Transport for the OpenAI SDK's HTTP client applying the shared retry policy."""
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        endpoint = endpoint_key(request.method, host, request.url.path)
+        attempt = 0
+        response = error = None
+        while True:
+            if not retrier.begin(endpoint):
+                # Mid-retry, surface the last real outcome instead of a synthetic error
+                if response is not None:
+                    return response
+                if error is not None:
+                    raise error
+                raise _sdk_http.ConnectError(f"Circuit open for {endpoint}", request=request)
+            response = error = None
+            try:
+                response = await super().handle_async_request(request)
+            except (_sdk_http.ConnectError, _sdk_http.ConnectTimeout,
+                    _sdk_http.ReadTimeout) as e:
+                delay = retrier.next_delay(endpoint, attempt)
+                if delay is None:
+                    raise
+                error = e
+                logger.warning(f"Request to {host} failed: {e}")
+            else:
+                if not is_retryable(response.status_code, response.headers):
+                    retrier.succeeded(endpoint)
+                    return response
+                delay = retrier.next_delay(
+                    endpoint, attempt, response.status_code, response.headers)
+                if delay is None:
+                    return response
+                # Buffer the error body so the response can still be returned later
+                await response.aread()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class RetryAdapter(HTTPAdapter):
+    """requests adapter applying the shared retry policy (used for GitHub and YouTube)."""
+
+    def send(self, request, **kwargs):
+        url = requests.utils.urlparse(request.url)
+        host = url.hostname
+        endpoint = endpoint_key(request.method, host, url.path)
+        attempt = 0
+        response = error = None
+        while True:
+            if not retrier.begin(endpoint):
+                # Mid-retry, surface the last real outcome instead of a synthetic error
+                if response is not None:
+                    return response
+                if error is not None:
+                    raise error
+                raise requests.ConnectionError(f"Circuit open for {endpoint}", request=request)
+            response = error = None
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = retrier.next_delay(endpoint, attempt)
+                if delay is None:
+                    raise
+                error = e
+                logger.warning(f"Request to {host} failed: {e}")
+            else:
+                if not is_retryable(response.status_code, response.headers):
+                    retrier.succeeded(endpoint)
+                    return response
+                delay = retrier.next_delay(
+                    endpoint, attempt, response.status_code, response.headers)
+                if delay is None:
+                    return response
+                # Read the error body so the response can still be returned later
+                response.content
+                response.close()
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,160 @@
+"""
+Admission control for assistant runs.
+
+Bounds how many runs are in flight globally and per question center, serves
+waiting forums round-robin, and paces run creation with a token bucket that
+follows the rate-limit headers OpenAI returns.
+"""
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from loguru import logger
+from .centers import centers
+from .retry import parse_duration
+
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", 8))
+MAX_RUNS_PER_FORUM = int(os.getenv("MAX_RUNS_PER_FORUM", 3))
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", 500))
+
+
+class TokenBucket:
+    """
+    Request bucket refilled continuously at `per_minute` tokens per minute.
+
+    OpenAI's x-ratelimit-* response headers correct the capacity and the
+    remaining tokens; when a limit is exhausted the bucket blocks until the
+    advertised reset.
+    """
+
+    def __init__(self, per_minute: int = OPENAI_RPM):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._reset_pending = False
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self._reset_pending and now >= self._blocked_until:
+            # The advertised reset has passed, the limit is replenished
+            self.tokens = self.capacity
+            self._reset_pending = False
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            wait = self._blocked_until - time.monotonic()
+            if wait <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            if wait <= 0:
+                wait = (1 - self.tokens) * 60 / self.capacity
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float) -> None:
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers) -> None:
+        self._refill()
+        if limit := headers.get("x-ratelimit-limit-requests"):
+            self.capacity = max(float(limit), 1.0)
+        if (remaining := headers.get("x-ratelimit-remaining-requests")) is not None:
+            self.tokens = min(self.tokens, float(remaining))
+
+        for kind in ("requests", "tokens"):
+            if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    logger.warning(f"OpenAI {kind} limit exhausted, pausing runs for {reset:.1f}s")
+                    self.block_for(reset)
+                    self._reset_pending = True
+
+
+class RunScheduler:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_RUNS,
+                 per_forum: int = MAX_RUNS_PER_FORUM, bucket: TokenBucket = None):
+        self.max_concurrent = max_concurrent
+        self.per_forum = per_forum
+        self.bucket = bucket or TokenBucket()
+        self._running = 0
+        self._running_by_forum = Counter()
+        self._waiting = OrderedDict()  # forum ID -> deque of futures, in arrival order
+        self._grants = 0
+        self._last_served = {}  # forum ID -> grant number of its latest admitted run
+
+    def _forum_limit(self, forum_id) -> int:
+        center = centers.get(forum_id) if forum_id else None
+        return (center or {}).get("max_concurrent_runs", self.per_forum)
+
+    def _can_run(self, forum_id) -> bool:
+        return (self._running < self.max_concurrent
+                and self._running_by_forum[forum_id] < self._forum_limit(forum_id))
+
+    def _grant(self, forum_id) -> None:
+        self._running += 1
+        self._running_by_forum[forum_id] += 1
+        self._grants += 1
+        self._last_served[forum_id] = self._grants
+
+    def _release(self, forum_id) -> None:
+        self._running -= 1
+        self._running_by_forum[forum_id] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admits waiting runs, always serving the least recently served forum first."""
+        while self._running < self.max_concurrent:
+            for forum_id in list(self._waiting):
+                queue = self._waiting[forum_id]
+                while queue and queue[0].done():  # cancelled while waiting
+                    queue.popleft()
+                if not queue:
+                    del self._waiting[forum_id]
+
+            ready = [forum_id for forum_id in self._waiting if self._can_run(forum_id)]
+            if not ready:
+                return
+            # Forums never served come first, in arrival order (min is stable)
+            forum_id = min(ready, key=lambda forum: self._last_served.get(forum, 0))
+            self._grant(forum_id)
+            self._waiting[forum_id].popleft().set_result(None)
+
+    async def _acquire(self, forum_id) -> None:
+        if self._can_run(forum_id) and not self._waiting.get(forum_id):
+            self._grant(forum_id)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(forum_id, deque()).append(future)
+        logger.info(
+            f"Run queued for forum {forum_id} (queue depth {self.queue_depth()})")
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(forum_id)  # admitted just before being cancelled
+            raise
+
+    @asynccontextmanager
+    async def slot(self, forum_id=None):
+        """Holds a run slot for `forum_id` for the duration of the block."""
+        await self._acquire(forum_id)
+        try:
+            await self.bucket.acquire()
+            yield
+        finally:
+            self._release(forum_id)
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": self.queue_depth(),
+            "queued_by_forum": {forum_id: len(queue) for forum_id, queue in self._waiting.items()},
+        }
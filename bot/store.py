@@ -0,0 +1,102 @@
+"""
+Durable state that has to survive restarts and deploys.
+"""
+import os
+import sqlite3
+import threading
+import time
+from loguru import logger
+from .cache import TTLCache
+
+DATA_DIR = "data"
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """Opens (and creates) a SQLite database under DATA_DIR."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return sqlite3.connect(os.path.join(DATA_DIR, name), check_same_thread=False)
+
+
+class PostStore:
+    """
+    Maps Discord post IDs to OpenAI thread IDs.
+
+    Backed by SQLite with an in-memory LRU in front, so hot lookups never hit
+    the disk and memory stays bounded. Posts without activity for
+    `max_age_days` are expired.
+    """
+
+    TOUCH_INTERVAL = 24 * 60 * 60  # refresh last activity at most once a day
+    EXPIRE_INTERVAL = 60 * 60
+
+    def __init__(self, db_name: str = "posts.sqlite3", max_age_days: int = 30,
+                 cache_size: int = 1024):
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._cache = TTLCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        self._conn = connect(db_name)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                "post_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS posts_updated_at ON posts (updated_at)"
+            )
+        self._last_expire = 0.0
+        self.expire()
+
+    def get(self, post_id, default=None):
+        key = str(post_id)
+        cached = self._cache.get(key)
+        if cached is not None:
+            thread_id, updated_at = cached
+        else:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT thread_id, updated_at FROM posts WHERE post_id = ?", (key,)
+                ).fetchone()
+            if row is None:
+                return default
+            thread_id, updated_at = row
+
+        now = time.time()
+        if now - updated_at > self.TOUCH_INTERVAL:
+            self._write(key, thread_id, now)
+        elif cached is None:
+            self._cache.set(key, (thread_id, updated_at))
+        return thread_id
+
+    def _write(self, key: str, thread_id: str, updated_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO posts (post_id, thread_id, updated_at) VALUES (?, ?, ?)",
+                (key, thread_id, updated_at)
+            )
+        self._cache.set(key, (thread_id, updated_at))
+
+    def __getitem__(self, post_id):
+        thread_id = self.get(post_id)
+        if thread_id is None:
+            raise KeyError(post_id)
+        return thread_id
+
+    def __setitem__(self, post_id, thread_id) -> None:
+        self._write(str(post_id), thread_id, time.time())
+        if time.time() - self._last_expire > self.EXPIRE_INTERVAL:
+            self.expire()
+
+    def __contains__(self, post_id) -> bool:
+        return self.get(post_id) is not None
+
+    def expire(self) -> None:
+        """Deletes posts without activity for longer than max_age."""
+        cutoff = time.time() - self.max_age
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM posts WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        self._last_expire = time.time()
+        if deleted:
+            self._cache.clear()
+            logger.info(f"Expired {deleted} posts older than {self.max_age // 86400} days")
@@ -0,0 +1,121 @@
+"""
+Progressive delivery of assistant replies into Discord.
+"""
+import asyncio
+import hikari
+from loguru import logger
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """Splits text into Discord-sized chunks, preferring line then word breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit)
+        if cut == -1:
+            cut = text.rfind(" ", limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n ")
+    chunks.append(text)
+    return chunks
+
+
+async def send_reply(channel: hikari.TextableChannel, text: str) -> list[hikari.Message]:
+    """Sends a reply, split across messages when it exceeds Discord's limit."""
+    return [await channel.send(chunk) for chunk in split_message(text)]
+
+
+class ReplyStream:
+    """
+    Streams a reply into a channel: posts a placeholder, then edits it as text
+    arrives, continuing in new messages past Discord's 2000-character limit.
+
+    Edits are made from a background task at most once per EDIT_INTERVAL, so
+    token deltas never wait on Discord and the channel's edit rate limit is
+    respected.
+    """
+
+    EDIT_INTERVAL = 1.5  # seconds
+    PLACEHOLDER = "✍️ …"
+    CURSOR = " …"
+
+    def __init__(self, channel: hikari.TextableChannel):
+        self.channel = channel
+        self.messages: list[hikari.Message] = []
+        self._rendered: list[str] = []
+        self._text = ""
+        self._dirty = False
+        self._pump = None
+
+    async def start(self) -> hikari.Message:
+        message = await self.channel.send(self.PLACEHOLDER)
+        self.messages.append(message)
+        self._rendered.append(self.PLACEHOLDER)
+        self._pump = asyncio.create_task(self._run())
+        return message
+
+    async def write(self, delta: str) -> None:
+        self._text += delta
+        self._dirty = True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.EDIT_INTERVAL)
+            if self._dirty:
+                self._dirty = False
+                try:
+                    await self._render(self._text + self.CURSOR)
+                except hikari.HTTPError as e:
+                    logger.warning(f"Could not update streamed reply: {e}")
+
+    async def _render(self, text: str) -> list[hikari.Message]:
+        """Makes the posted messages show `text`, editing only what changed."""
+        chunks = split_message(text)
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self._rendered[i] != chunk:
+                    await self.messages[i].edit(chunk)
+                    self._rendered[i] = chunk
+            else:
+                self.messages.append(await self.channel.send(chunk))
+                self._rendered.append(chunk)
+
+        # The final text can be shorter than what was streamed
+        while len(self.messages) > len(chunks):
+            await self.messages.pop().delete()
+            self._rendered.pop()
+        return list(self.messages)
+
+    async def _stop(self) -> None:
+        if self._pump:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                # A dead pump only means progress edits stopped; the final
+                # render or the cleanup still has to run
+                logger.error(f"Streamed reply updates failed: {e}")
+            self._pump = None
+
+    async def finish(self, text: str) -> list[hikari.Message]:
+        """Replaces the streamed text with the final reply."""
+        await self._stop()
+        return await self._render(text)
+
+    async def abort(self) -> list[int]:
+        """Removes the placeholder and any partial reply, returning the deleted message IDs."""
+        await self._stop()
+        deleted = [message.id for message in self.messages]
+        for message in self.messages:
+            try:
+                await message.delete()
+            except Exception as e:
+                logger.warning(f"Could not delete streamed reply {message.id}: {e}")
+        self.messages.clear()
+        self._rendered.clear()
+        return deleted
@@ -0,0 +1,79 @@
+"""
+Persistent one-shot deadlines.
+"""
+import asyncio
+import heapq
+import json
+import time
+from loguru import logger
+from .store import connect
+
+
+class DeadlineTimers:
+    """
+    One-shot timers keyed by ID, kept in a heap and persisted in SQLite.
+
+    Armed timers survive restarts (overdue ones fire right after boot), each
+    timer fires at most once, and cancelling is O(1): stale heap entries are
+    skipped when they reach the top.
+    """
+
+    def __init__(self, db_name: str = "timers.sqlite3"):
+        self._conn = connect(db_name)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS timers ("
+                "key TEXT PRIMARY KEY, deadline REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+        self._timers = {}  # key -> (deadline, payload)
+        for key, deadline, payload in self._conn.execute("SELECT key, deadline, payload FROM timers"):
+            self._timers[key] = (deadline, json.loads(payload))
+        self._heap = [(deadline, key) for key, (deadline, _) in self._timers.items()]
+        heapq.heapify(self._heap)
+        self._wakeup = asyncio.Event()
+
+    def arm(self, key: str, deadline: float, payload: dict) -> None:
+        """Schedules `key` to fire at `deadline` (epoch seconds), replacing any earlier timer."""
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO timers (key, deadline, payload) VALUES (?, ?, ?)",
+                (key, deadline, json.dumps(payload))
+            )
+        self._timers[key] = (deadline, payload)
+        heapq.heappush(self._heap, (deadline, key))
+        self._wakeup.set()
+
+    def cancel(self, key: str) -> bool:
+        if self._timers.pop(key, None) is None:
+            return False
+        with self._conn:
+            self._conn.execute("DELETE FROM timers WHERE key = ?", (key,))
+        return True
+
+    def get(self, key: str) -> dict | None:
+        timer = self._timers.get(key)
+        return timer[1] if timer else None
+
+    async def run(self, callback) -> None:
+        """Fires due timers forever, awaiting `callback(key, payload)` for each."""
+        while True:
+            # Drop heap entries of cancelled or re-armed timers
+            while self._heap and self._timers.get(self._heap[0][1], (None,))[0] != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, key = heapq.heappop(self._heap)
+            payload = self._timers[key][1]
+            self.cancel(key)
+            try:
+                await callback(key, payload)
+            except Exception as e:
+                logger.error(f"Timer {key} failed: {e}")
@@ -6,21 +6,53 @@ import json
 import re
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from .cache import CACHE_DIR, DiskCache, TTLCache
+from .centers import centers
+from .retry import RetryAdapter
+from .lexical import reciprocal_rank_fusion
+from .retrieval import get_lexical_index, get_vector_store, get_version
 
 load_dotenv()
 
+GITHUB_API = "https://api.github.com"
+CODE_EXTENSIONS = (".py", ".js", ".jsx", ".tsx", ".ts", ".html", ".css", ".cs", ".json")
+MAX_DOWNLOAD_WORKERS = 8
+REQUEST_TIMEOUT = 30  # seconds
+
+# Repository code handed to the model is packed into a token budget
+REPO_TOKEN_BUDGET = int(os.getenv("REPO_TOKEN_BUDGET", 30000))
+REPO_MAX_FILE_TOKENS = int(os.getenv("REPO_MAX_FILE_TOKENS", 6000))
+SKIPPED_FILE_NAMES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "composer.lock",
+    "poetry.lock", "Pipfile.lock", "tsconfig.tsbuildinfo",
+}
+GENERATED_DIRS = {
+    "node_modules", "dist", "build", "out", ".next", "vendor", "coverage",
+    "__pycache__", ".venv", "venv", "Library", "obj", "bin",
+}
+ENTRY_POINT_NAMES = {"main", "app", "index", "server", "program", "__init__"}
+
+# Pooled connections shared by all tool calls, with the shared retry policy
+_session = requests.Session()
+_session.mount("https://", RetryAdapter(pool_maxsize=MAX_DOWNLOAD_WORKERS))
+
+# Fetched repository files keyed by (owner, repo, path, commit SHA), plus the
+# ETag of the last commit lookup per repository
+_repo_cache = DiskCache(os.path.join(CACHE_DIR, "github"))
+# Resolved HEAD commits, trusted without any request for a few minutes
+_commit_cache = TTLCache(maxsize=256, ttl=5 * 60)
+
+# search_db results keyed by (index version, normalized query, k)
+_search_cache = TTLCache(maxsize=512, ttl=6 * 60 * 60)
+
 
 def get_ta_role_for_forum(forum_id: int) -> str:
     """Get TA role ID for a specific forum channel"""
-    from .extensions.questions import QUESTION_CENTERS
-    for center in QUESTION_CENTERS.values():
-        if center["forum_id"] == forum_id:
-            return str(center["ta_id"])
-    return None
+    ta_id = centers.ta_role_for(int(forum_id))
+    return str(ta_id) if ta_id else None
 
 
 def extract_owner(text: str) -> str:
@@ -41,18 +73,85 @@ def extract_repo(text: str) -> str:
     return match.group(2) if match else None
 
 
-def fetch_all_code_from_repo(owner: str, repo: str, path: str = "") -> str:
+def _github_headers(accept: str = "application/vnd.github+json") -> dict:
+    return {
+        "Accept": accept,
+        "Authorization": f"Bearer {os.environ['GITHUB_TOKEN']}",
+    }
+
+
+def _fetch_tree(owner: str, repo: str, ref: str = "HEAD") -> list[dict]:
+    """Lists every entry of a repository tree in a single request."""
+    url = f"{GITHUB_API}/repos/{owner}/{repo}/git/trees/{ref}"
+    response = _session.get(
+        url, headers=_github_headers(), params={"recursive": 1}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    tree = response.json()
+    if tree.get("truncated"):
+        logger.warning(
+            f"Tree of {owner}/{repo} is truncated by GitHub, some files are skipped")
+    return tree["tree"]
+
+
+def _resolve_commit(owner: str, repo: str) -> str:
+    """
+    Resolves the HEAD commit SHA of a repository.
+
+    Within the TTL no request is made; after it, a conditional request with
+    the stored ETag costs a single 304 when the repository did not change.
+    """
+    sha = _commit_cache.get((owner, repo))
+    if sha:
+        return sha
+
+    ref_key = ["commit", owner, repo]
+    known = _repo_cache.get(ref_key)
+    headers = _github_headers("application/vnd.github.sha")
+    if known:
+        headers["If-None-Match"] = known["etag"]
+
+    url = f"{GITHUB_API}/repos/{owner}/{repo}/commits/HEAD"
+    response = _session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        sha = known["sha"]
+    else:
+        response.raise_for_status()
+        sha = response.text.strip()
+        if etag := response.headers.get("ETag"):
+            _repo_cache.set(ref_key, {"sha": sha, "etag": etag})
+
+    _commit_cache.set((owner, repo), sha)
+    return sha
+
+
+def _fetch_blob(owner: str, repo: str, sha: str) -> str:
+    """Downloads the raw content of a blob."""
+    url = f"{GITHUB_API}/repos/{owner}/{repo}/git/blobs/{sha}"
+    response = _session.get(
+        url, headers=_github_headers("application/vnd.github.raw"), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.content.decode("utf-8", errors="replace")
+
+
+def fetch_all_code_from_repo(owner: str, repo: str, path: str = "", question: str = "") -> str:
     """
     Fetches all code files from a specified GitHub repository path.
     If the path is empty, starts from the repository's root.
 
+    The whole tree is listed with one request, then matching files are
+    downloaded concurrently over a pooled session and cached per commit SHA.
+    Lockfiles and generated or minified files are skipped, and the rest is
+    ranked by relevance to the question and packed into REPO_TOKEN_BUDGET.
+
     Args:
         owner: The owner of the GitHub repository.
         repo: The name of the GitHub repository.
         path: The directory path within the repository to fetch files from. Defaults to the root directory.
+        question: The learner's question, used to rank files by relevance.
 
     Returns:
-        str: A concatenated string containing the content of all relevant code files in the repository.
+        str: A concatenated string containing the most relevant code files, truncated to the token budget.
 
     Example:
         Fetch all code files from the root of the repository:
@@ -65,29 +164,150 @@ def fetch_all_code_from_repo(owner: str, repo: str, path: str = "") -> str:
         code = fetch_all_code_from_repo("example-owner", "example-repo", "src")
         ```
     """
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-    headers = {
-        "Accept": "application/vnd.github+json",
-    }
-    headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    files = _fetch_repo_files(owner, repo, path)
+    return _pack_code(files, question, path)
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
 
-    contents = response.json()
-    logger.info(f"Fetching {len(contents)} files from {url}")
-    all_code = ""
+def _estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token."""
+    return len(text) // 4 + 1
+
 
-    for item in contents:
-        if item["type"] == "file" and item["name"].endswith(
-            (".py", ".js", ".jsx", "tsx", "ts", "html", "css", ".cs", ".json")
-        ):
-            file_response = requests.get(item["download_url"])
-            all_code += f"\n\n# File: {item['path']}\n" + file_response.text
-        elif item["type"] == "dir":
-            all_code += fetch_all_code_from_repo(owner, repo, item["path"])
+def _is_generated(file_path: str, content: str) -> bool:
+    """Detects lockfiles, build output and minified bundles."""
+    parts = file_path.split("/")
+    name = parts[-1]
+    if name in SKIPPED_FILE_NAMES or GENERATED_DIRS.intersection(parts[:-1]):
+        return True
+    if ".min." in name or name.endswith((".bundle.js", ".map")):
+        return True
+    lines = content.count("\n") + 1
+    return len(content) / lines > 300
 
-    return all_code
+
+def _terms(text: str) -> set[str]:
+    return {term for term in re.split(r"[^a-z0-9]+", text.lower()) if len(term) >= 3}
+
+
+def _rank_files(files: list[list[str]], question: str, path: str) -> list[list[str]]:
+    """Orders files by how well they match the question and the requested path."""
+    query_terms = _terms(question) | _terms(path)
+
+    def score(item):
+        file_path, content = item
+        path_terms = _terms(file_path)
+        stem = file_path.rsplit("/", 1)[-1].split(".")[0].lower()
+        content_terms = _terms(content[:20000]) if query_terms else set()
+        return (
+            4 * len(query_terms & path_terms)
+            + 2 * min(len(query_terms & content_terms), 10)
+            + (1 if stem in ENTRY_POINT_NAMES else 0)
+            - 0.5 * file_path.count("/")
+        )
+
+    return sorted(files, key=lambda item: (-score(item), item[0]))
+
+
+def _truncate(content: str, max_tokens: int) -> str:
+    """Cuts content to roughly max_tokens at a line boundary, with a marker."""
+    limit = max_tokens * 4
+    if len(content) <= limit:
+        return content
+    cut = content.rfind("\n", 0, limit)
+    kept = content[:cut if cut > 0 else limit]
+    remaining = content.count("\n", len(kept)) + 1
+    return f"{kept}\n# ... truncated {remaining} more lines"
+
+
+def _pack_code(files: list[list[str]], question: str = "", path: str = "") -> str:
+    """Fills REPO_TOKEN_BUDGET with the most relevant files, skipping generated ones."""
+    candidates = [item for item in files if not _is_generated(*item)]
+    skipped = len(files) - len(candidates)
+
+    budget = REPO_TOKEN_BUDGET
+    packed = []
+    omitted = []
+    for file_path, content in _rank_files(candidates, question, path):
+        header = f"\n\n# File: {file_path}\n"
+        allowed = min(REPO_MAX_FILE_TOKENS, budget - _estimate_tokens(header))
+        if allowed < 200:
+            omitted.append(file_path)
+            continue
+        content = _truncate(content, allowed)
+        packed.append(header + content)
+        budget -= _estimate_tokens(header + content)
+
+    if skipped:
+        packed.append(f"\n\n# Skipped {skipped} lockfiles, generated or minified files")
+    if omitted:
+        packed.append(
+            f"\n\n# Omitted to stay within the token budget: {', '.join(omitted)}")
+    return "".join(packed)
+
+
+def _fetch_repo_files(owner: str, repo: str, path: str = "") -> list[list[str]]:
+    """Returns [path, content] pairs of the code files under `path` at HEAD, cached per commit."""
+    prefix = path.strip("/")
+    sha = _resolve_commit(owner, repo)
+    cache_key = ["files", owner, repo, prefix, sha]
+    cached = _repo_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Using cached files of {owner}/{repo}/{prefix} at {sha[:7]}")
+        return cached
+
+    files = sorted(
+        (
+            item for item in _fetch_tree(owner, repo, sha)
+            if item["type"] == "blob"
+            and item["path"].endswith(CODE_EXTENSIONS)
+            and (not prefix or item["path"] == prefix or item["path"].startswith(f"{prefix}/"))
+        ),
+        key=lambda item: item["path"]
+    )
+    logger.info(f"Fetching {len(files)} files from {owner}/{repo}/{prefix}")
+
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as pool:
+        contents = pool.map(
+            lambda item: _fetch_blob(owner, repo, item["sha"]), files)
+
+    result = [[item["path"], content] for item, content in zip(files, contents)]
+    _repo_cache.set(cache_key, result)
+    return result
+
+
+def _normalize_query(query: str) -> str:
+    """Lowercases, collapses whitespace and strips trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def _hybrid_search(db, query: str, k: int) -> list:
+    """
+    Ranks chunks with the BM25 index first. Confident lexical hits (exact codes,
+    numbers or identifiers) are returned without an embedding call; otherwise
+    lexical and vector rankings are merged with reciprocal rank fusion.
+
+    Returns (document, score) pairs; the score is the Chroma distance for
+    pure vector results and None for lexical or fused ones, whose scores are
+    on a different scale.
+    """
+    index = get_lexical_index()
+    lexical = index.search(query, k=k * 2) if index is not None else []
+    if lexical and index.is_confident(query, lexical):
+        logger.info(f"search_db answered lexically for {query!r}")
+        return [(index.document(chunk_id), None) for chunk_id, _ in lexical[:k]]
+
+    vector = db.similarity_search_with_score(query, k=k * 2)
+    if not lexical:
+        return vector[:k]
+
+    # Chunks are keyed by the IDs assigned in create_vector_store
+    documents = {doc.metadata.get("id"): doc for doc, _ in vector}
+    vector_ids = [doc.metadata.get("id") for doc, _ in vector]
+    fused = reciprocal_rank_fusion([chunk_id for chunk_id, _ in lexical], vector_ids)
+    return [
+        (documents.get(chunk_id) or index.document(chunk_id), None)
+        for chunk_id, _ in fused[:k]
+    ]
 
 
 def search_db(query: str, k: int = 5) -> str:
@@ -106,21 +326,20 @@ def search_db(query: str, k: int = 5) -> str:
         'Document 1: From data/monopoly.pdf, page 2: In Monopoly, players start with $1500...'
     """
     try:
-        # Initialize the embedding function
-        embedding_function = OpenAIEmbeddings(model="text-embedding-3-large")
-
-        # Initialize Chroma DB
-        CHROMA_PATH = "chroma"
-        if not os.path.exists(CHROMA_PATH):
-            logger.error(f"Chroma DB path {CHROMA_PATH} does not exist")
+        # Reuse the process-wide Chroma DB
+        db = get_vector_store()
+        if db is None:
             return "Error: The database has not been initialized. Please contact an administrator."
 
-        db = Chroma(persist_directory=CHROMA_PATH,
-                    embedding_function=embedding_function)
-
-        # Search the DB
-        results = db.similarity_search_with_score(query, k=k)
+        # Entries from an older index version are never hit again and age out
+        cache_key = (get_version(), _normalize_query(query), k)
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            logger.info(
+                f"search_db cache hit (hit rate {_search_cache.stats()['hit_rate']:.0%})")
+            return cached
 
+        results = _hybrid_search(db, query, k)
         if not results:
             return "No relevant information found in the database."
 
@@ -134,11 +353,15 @@ def search_db(query: str, k: int = 5) -> str:
             formatted_result = f"Document {i}: From {source}"
             if page != "Unknown page":
                 formatted_result += f", page {page}"
-            formatted_result += f" (relevance: {score:.2f}):\n{content}\n"
+            if score is not None:
+                formatted_result += f" (relevance: {score:.2f})"
+            formatted_result += f":\n{content}\n"
 
             formatted_results.append(formatted_result)
 
-        return "\n\n".join(formatted_results)
+        output = "\n\n".join(formatted_results)
+        _search_cache.set(cache_key, output)
+        return output
 
     except Exception as e:
         logger.error(f"Error searching database: {str(e)}")
@@ -171,7 +394,7 @@ def search_youtube(query, max_results=5):
             "(KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
         )
     }
-    response = requests.get(url, headers=headers)
+    response = _session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
 
     # 1. Extract JSON from 'ytInitialData'
     match = re.search(r"var ytInitialData = ({.*?});", response.text)
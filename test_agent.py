@@ -1,9 +1,10 @@
 from bot.agent import Assistant
+import asyncio
 import os
 from loguru import logger
 
 
-def run_test_scenario(assistant, scenario_number, initial_question, follow_up_question=None):
+async def run_test_scenario(assistant, scenario_number, initial_question, follow_up_question=None):
     """Run a test scenario with the given initial and follow-up questions."""
     print(f"\n\n{'=' * 80}")
     print(f"SCENARIO {scenario_number}")
@@ -15,13 +16,13 @@ def run_test_scenario(assistant, scenario_number, initial_question, follow_up_qu
     post_id = f"test_post_{scenario_number}"
 
     # Create thread with initial question, set forum ID to Data Science forum
-    thread = assistant.create_thread(
+    thread = await assistant.create_thread(
         message=initial_question, forum_id=1081063200377806899)
     assistant.posts[post_id] = thread.id
 
     # Get initial response
-    messages = assistant.create_and_run_thread(thread)
-    response, citations = assistant.extract_response(messages)
+    messages = await assistant.create_and_run_thread(thread)
+    response, citations = await assistant.extract_response(messages)
 
     print("\nBot response:")
     print("-" * 50)
@@ -36,7 +37,7 @@ def run_test_scenario(assistant, scenario_number, initial_question, follow_up_qu
         print("-" * 50)
 
         # Continue thread with follow-up question
-        response, citations = assistant.continue_thread(
+        response, citations = await assistant.continue_thread(
             message=follow_up_question,
             post_id=post_id
         )
@@ -49,30 +50,31 @@ def run_test_scenario(assistant, scenario_number, initial_question, follow_up_qu
             print(f"Referenced files: {', '.join(citations)}")
 
 
-def main():
+async def main():
     try:
         # Initialize the assistant with documentation
         file_paths = [
             f"docs/{filename}" for filename in os.listdir('docs')] if os.path.exists('docs') else []
         assistant = Assistant(file_paths)
+        await assistant.start()
 
         # NOTE: Scenario 1: Course content (search in chromadb)
         question = "How many modules will I be learning in the Data Science course? What are they? Are they all mandatory?"
-        run_test_scenario(assistant, 1, question)
+        await run_test_scenario(assistant, 1, question)
 
         # NOTE: Scenario 2: Search for resources
         question = "I want to learn about AI engineering, RAG in particular. How can I learn it?"
         follow_up = "I actually know the basics, I want to implement my own assistant with openai assistant api. How can I learn how to to it?"
-        run_test_scenario(assistant, 2, question, follow_up)
+        await run_test_scenario(assistant, 2, question, follow_up)
 
         # NOTE: Scenario 3: Exam question
         question = "please help me with this question: Question 12. Complete a function to calculate the difference between maximum and minimum values of a tuple of integers in other words, the maximum value minus the minimum value of the tuple."
         follow_up = "I have already attempted the question. Please give me the solution."
-        run_test_scenario(assistant, 3, question, follow_up)
+        await run_test_scenario(assistant, 3, question, follow_up)
 
         # NOTE: Scenario 4: Explain Github repository
         question = "I want to know more about this Github repository https://github.com/Tatetrix/cs50-project. What is it about?"
-        run_test_scenario(assistant, 4, question)
+        await run_test_scenario(assistant, 4, question)
         # NOTE: Scenario 4bis: Explain code error
         question = """
 bài 3 e chạy code trên sandbox ra kết quả đúng nhưng k pass test case, check giúp e với
@@ -116,7 +118,7 @@ const items = [
     },
 ];
 """
-        run_test_scenario(assistant, 4.5, question)
+        await run_test_scenario(assistant, 4.5, question)
 
         # NOTE: Scenario 5: Code review
         question = "Please review the following code:\n\n" + \
@@ -207,7 +209,7 @@ int main(int argc, string argv[]){
 
 Em muốn hỏi là nên fix lỗi kia như thế nào ạ? Em có cần cải thiện logic code ở đâu cho hợp lý không ạ?
     """
-        run_test_scenario(assistant, 5, question)
+        await run_test_scenario(assistant, 5, question)
 
         print("\nTest scenarios completed successfully!")
 
@@ -220,4 +222,4 @@ Em muốn hỏi là nên fix lỗi kia như thế nào ạ? Em có cần cải t
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
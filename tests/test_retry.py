@@ -0,0 +1,115 @@
+import time
+from bot.retry import (
+    CircuitBreaker, Retrier, RetryPolicy, endpoint_key, is_retryable, parse_duration)
+
+
+def test_parse_duration():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("120ms") == 0.12
+    assert parse_duration("1h2m3.5s") == 3723.5
+    assert parse_duration("") is None
+
+
+def test_retryable_statuses():
+    assert is_retryable(429, {})
+    assert is_retryable(503, {})
+    assert not is_retryable(404, {})
+    assert not is_retryable(403, {})
+    assert is_retryable(403, {"x-ratelimit-remaining": "0"})
+    assert is_retryable(403, {"retry-after": "10"})
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    for attempt in range(6):
+        delay = policy.delay(attempt, {})
+        assert 0 <= delay <= min(4, 2 ** attempt)
+
+
+def test_retry_after_seconds_and_date():
+    policy = RetryPolicy()
+    assert policy.delay(0, {"retry-after": "3"}) == 3
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 10))
+    assert 8 <= policy.delay(0, {"retry-after": date}) <= 10
+
+
+def test_server_wait_beyond_limit_gives_up():
+    assert RetryPolicy(max_server_wait=60).delay(0, {"retry-after": "120"}) is None
+
+
+def test_github_reset_only_when_exhausted():
+    policy = RetryPolicy(max_delay=1)
+    reset = str(time.time() + 1800)
+    # A 5xx with quota left is retried with backoff, not after the hourly reset
+    assert policy.delay(0, {"x-ratelimit-remaining": "4987", "x-ratelimit-reset": reset}) <= 1
+    assert policy.delay(0, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": reset}) is None
+    soon = str(time.time() + 5)
+    assert 4 <= policy.delay(0, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": soon}) <= 5
+
+
+def test_openai_reset_durations():
+    headers = {
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-remaining-tokens": "10", "x-ratelimit-reset-tokens": "30s",
+    }
+    assert RetryPolicy().delay(0, headers) == 2
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.record(success=False)
+    assert breaker.allow()
+    breaker.record(success=False)
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # one probe
+    assert not breaker.allow()
+    breaker.record(success=True)
+    assert breaker.allow()
+
+
+def test_rate_limits_do_not_open_the_circuit():
+    retrier = Retrier(RetryPolicy(max_attempts=2))
+    for _ in range(20):
+        assert retrier.begin("api")
+        retrier.next_delay("api", 0, 429, {"retry-after": "0"})
+    assert retrier.begin("api")
+
+
+def test_server_errors_open_the_circuit():
+    retrier = Retrier(RetryPolicy(max_attempts=2))
+    for _ in range(5):
+        assert retrier.begin("api")
+        retrier.next_delay("api", 0, 502, {})
+    assert not retrier.begin("api")
+    assert retrier.begin("other")
+    assert retrier.stats()["api:circuit_open"] == 1
+
+
+def test_retry_budget_limits_retries():
+    retrier = Retrier(RetryPolicy(max_attempts=100, base_delay=0))
+    delays = []
+    for attempt in range(20):
+        retrier.begin("api")
+        delays.append(retrier.next_delay("api", attempt, 429, {}))
+    assert None in delays
+    assert retrier.stats()["api:budget_exhausted"] >= 1
+
+
+def test_endpoint_key_templates_ids():
+    assert endpoint_key("GET", "api.openai.com", "/v1/threads/thread_abc123XYZ/runs/run_Q9xYz81kLm") \
+        == "GET api.openai.com/v1/threads/{id}/runs/{id}"
+    assert endpoint_key("POST", "api.openai.com", "/v1/files") == "POST api.openai.com/v1/files"
+    assert endpoint_key("GET", "api.github.com", "/repos/nauqh/ti/git/trees/4f2a9c1") \
+        == "GET api.github.com/repos/{owner}/{repo}/git/trees/{id}"
+
+
+def test_failing_endpoint_does_not_trip_others():
+    retrier = Retrier(RetryPolicy(max_attempts=2))
+    uploads = endpoint_key("POST", "api.openai.com", "/v1/files")
+    polls = endpoint_key("GET", "api.openai.com", "/v1/threads/thread_abc12345/runs/run_abc12345")
+    for _ in range(5):
+        assert retrier.begin(uploads)
+        retrier.next_delay(uploads, 0, 500, {})
+    assert not retrier.begin(uploads)
+    assert retrier.begin(polls)
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from bot.retry import RetryAdapter, RetryTransport
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first `failures` requests with a 503, then lists no models."""
+
+    failures = 0
+    requests_seen = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests_seen += 1
+        if cls.requests_seen <= cls.failures:
+            body, status = b'{"error": {"message": "unavailable"}}', 503
+        else:
+            body, status = json.dumps({"object": "list", "data": []}).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FlakyHandler.failures = 2
+    FlakyHandler.requests_seen = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_openai_client_retries_through_transport(server):
+    async def main():
+        client = AsyncOpenAI(
+            api_key="test", base_url=f"{server}/v1", max_retries=0,
+            http_client=DefaultAsyncHttpxClient(transport=RetryTransport()))
+        models = [model async for model in client.models.list()]
+        await client.close()
+        return models
+
+    assert asyncio.run(main()) == []
+    assert FlakyHandler.requests_seen == 3
+
+
+def test_requests_session_retries_through_adapter(server):
+    session = requests.Session()
+    session.mount("http://", RetryAdapter())
+    response = session.get(f"{server}/v1/models", timeout=5)
+    assert response.status_code == 200
+    assert FlakyHandler.requests_seen == 3
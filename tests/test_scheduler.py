@@ -0,0 +1,88 @@
+import asyncio
+from bot.scheduler import RunScheduler, TokenBucket
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _hold(scheduler, forum_id, order, release):
+    async with scheduler.slot(forum_id):
+        order.append(forum_id)
+        await release.wait()
+
+
+def test_caps_concurrency():
+    async def main():
+        scheduler = RunScheduler(max_concurrent=2, per_forum=2, bucket=TokenBucket(6000))
+        release = asyncio.Event()
+        order = []
+        tasks = [asyncio.create_task(_hold(scheduler, 1, order, release)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["running"] == 2
+        assert scheduler.queue_depth() == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert scheduler.stats()["running"] == 0
+        assert len(order) == 4
+    run(main())
+
+
+def test_per_forum_limit():
+    async def main():
+        scheduler = RunScheduler(max_concurrent=8, per_forum=1, bucket=TokenBucket(6000))
+        release = asyncio.Event()
+        order = []
+        tasks = [asyncio.create_task(_hold(scheduler, forum, order, release))
+                 for forum in (1, 1, 2)]
+        await asyncio.sleep(0.01)
+        assert sorted(order) == [1, 2]
+        assert scheduler.stats()["queued_by_forum"] == {1: 1}
+        release.set()
+        await asyncio.gather(*tasks)
+    run(main())
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def main():
+        scheduler = RunScheduler(max_concurrent=1, per_forum=1, bucket=TokenBucket(6000))
+        release = asyncio.Event()
+        order = []
+        first = asyncio.create_task(_hold(scheduler, 1, order, release))
+        waiting = asyncio.create_task(_hold(scheduler, 2, order, release))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        release.set()
+        await first
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.stats() == {"running": 0, "queued": 0, "queued_by_forum": {}}
+    run(main())
+
+
+def test_bucket_blocks_until_reset():
+    async def main():
+        bucket = TokenBucket(6000)
+        bucket.update_from_headers({
+            "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "100ms"})
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire()
+        assert loop.time() - start >= 0.09
+    run(main())
+
+
+def test_round_robin_across_forums():
+    async def main():
+        scheduler = RunScheduler(max_concurrent=2, per_forum=1, bucket=TokenBucket(6000))
+        order = []
+
+        async def quick(forum_id):
+            async with scheduler.slot(forum_id):
+                order.append(forum_id)
+                await asyncio.sleep(0.01)
+
+        # Forums 1 and 2 each queue a second run before forum 3 arrives
+        tasks = [asyncio.create_task(quick(forum)) for forum in (1, 2, 1, 2, 3)]
+        await asyncio.gather(*tasks)
+        assert order.index(3) < 3
+    run(main())